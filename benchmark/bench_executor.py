@@ -0,0 +1,60 @@
+"""
+比较不同执行后端解析与构造 model 的耗时
+
+    python benchmark/bench_executor.py [--scale 50] [--rounds 5]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from fuo_migu.executor import BackendMode, create_backend, to_model
+from fuo_migu.schema import ArtistSongsResult
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+def load_payload(scale: int) -> bytes:
+    data = json.loads((EXAMPLE / 'artist_songs.json').read_text(encoding='utf-8'))
+    data['result']['results'] = data['result']['results'] * scale
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def bench(mode: BackendMode, payload: bytes, rounds: int):
+    backend = create_backend(mode)
+    # 预热，排除进程池启动的开销
+    backend.run(ArtistSongsResult.parse_raw, payload)
+    backend.stats.reset()
+    parse_seconds = hydrate_seconds = blocked_seconds = 0.0
+    count = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = backend.run(ArtistSongsResult.parse_raw, payload)
+        parse_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        future = backend.map_async(to_model, result.result.results)
+        # 调用方（如 GUI 线程）被占用的时间，inline 模式下等于全部耗时
+        blocked_seconds += time.perf_counter() - start
+        count = len(future.result())
+        hydrate_seconds += time.perf_counter() - start
+    stats = backend.stats
+    backend.shutdown()
+    print(f'{mode.value:>8}: songs={count} parse={parse_seconds / rounds * 1000:.1f}ms '
+          f'hydrate={hydrate_seconds / rounds * 1000:.1f}ms blocked={blocked_seconds / rounds * 1000:.1f}ms '
+          f'pickle={stats.pickle_bytes / rounds / 1024:.0f}KiB/{stats.pickle_seconds / rounds * 1000:.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    payload = load_payload(args.scale)
+    print(f'payload: {len(payload) / 1024:.0f}KiB')
+    for mode in BackendMode:
+        bench(mode, payload, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+比较 parse_raw 与按字段统计生成的投影解析的吞吐量
+
+    python benchmark/bench_projection.py [--rounds 200] [--usage field_usage.json]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from fuo_migu.projection import ProjectionParser, field_usage
+from fuo_migu.schema import SongSearchResult, ArtistSearchResult, AlbumSearchResult, PlaylistSearchResult, \
+    MvSearchResult, SongDetailResult, ArtistDetailResult, ArtistSongsResult, AlbumDetailResult, PlaylistDetailResult, \
+    PlaylistSongsResult, AlbumSongsResult, MvDetailResult
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+# 示例文件 -> (结果类型, 与 models/service 中一致的读取方式)
+FIXTURES = {
+    'search_songs.json': (SongSearchResult, lambda r: [o.model() for o in r.musics]),
+    'search_artists.json': (ArtistSearchResult, lambda r: [o.model() for o in r.artists]),
+    'search_album.json': (AlbumSearchResult, lambda r: [o.model() for o in r.albums]),
+    'search_playlist.json': (PlaylistSearchResult, lambda r: [o.model() for o in r.playlists]),
+    'search_mv.json': (MvSearchResult, lambda r: [o.model() for o in r.mv]),
+    'song_detail.json': (SongDetailResult, lambda r: r.data.model()),
+    'artist_detail.json': (ArtistDetailResult, lambda r: (r.data.artist_id, r.data.artist_name,
+                                                          r.data.similar_artist_names, r.data.represent_work_titles)),
+    'artist_songs.json': (ArtistSongsResult, lambda r: (r.result.total_count, [o.model() for o in r.result.results])),
+    'album_detail.json': (AlbumDetailResult, lambda r: r.data.model()),
+    'album_songs.json': (AlbumSongsResult, lambda r: (r.result.total_count, [o.model() for o in r.result.results])),
+    'mv_detail.json': (MvDetailResult, lambda r: r.data.model()),
+    'playlist_detail.json': (PlaylistDetailResult, lambda r: r.rsp),
+    'playlist_songs.json': (PlaylistSongsResult, lambda r: r.content_list),
+}
+
+
+def collect_usage():
+    for name, (result_type, read) in FIXTURES.items():
+        field_usage.observe(result_type)
+    field_usage.enable()
+    try:
+        for name, (result_type, read) in FIXTURES.items():
+            read(result_type.parse_file(EXAMPLE / name))
+    finally:
+        field_usage.disable()
+    return field_usage.used()
+
+
+def timeit(func, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--usage', help='同时把字段统计写入该文件')
+    args = parser.parse_args()
+
+    used = collect_usage()
+    if args.usage:
+        field_usage.dump(args.usage)
+    total_full = total_projection = 0.0
+    for name, (result_type, read) in FIXTURES.items():
+        content = (EXAMPLE / name).read_bytes()
+        projection = ProjectionParser(result_type, used)
+        read(projection(json.loads(content)))
+        full = timeit(lambda: result_type.parse_raw(content), args.rounds)
+        projected = timeit(lambda: projection(json.loads(content)), args.rounds)
+        total_full += full
+        total_projection += projected
+        print(f'{name:>22}: parse_raw={full * 1e6:8.1f}us projection={projected * 1e6:8.1f}us '
+              f'speedup={full / projected:5.2f}x fallbacks={projection.fallbacks}')
+    print(f'{"total":>22}: parse_raw={total_full * 1e6:8.1f}us projection={total_projection * 1e6:8.1f}us '
+          f'speedup={total_full / total_projection:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
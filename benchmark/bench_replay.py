@@ -0,0 +1,57 @@
+"""
+基于 cassette 的离线压测：先联网录制一次，之后可以离线、可复现地回放
+
+    python benchmark/bench_replay.py --record migu.jsonl.gz
+    python benchmark/bench_replay.py --replay migu.jsonl.gz [--clients 16] [--timing-scale 1.0]
+"""
+import argparse
+import statistics
+
+from fuo_migu.cassette import RecordingAdapter, ReplayAdapter, run_virtual_clients
+from fuo_migu.executor import to_model
+from fuo_migu.schema import SearchType
+from fuo_migu.service import MiguService
+
+
+KEYWORD = 'only my railgun'
+
+
+def scenario(service: MiguService):
+    """ 搜索歌曲，打开第一首歌所在的专辑并构造全部 model """
+    result = service.search(KEYWORD, SearchType.song, 1, 30)
+    songs = [o.model() for o in result.musics]
+    album_id = next((o.album_id for o in result.musics if o.album_id), None)
+    if album_id is not None:
+        service.album_detail(album_id).data.model()
+        songs += service.backend.map(to_model, service.album_songs(album_id, 1, 30).result.results)
+    return len(songs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--record')
+    group.add_argument('--replay')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--timing-scale', type=float, default=None)
+    args = parser.parse_args()
+
+    service = MiguService()
+    if args.record:
+        service.mount(RecordingAdapter(args.record))
+        print(f'models: {scenario(service)}')
+        service.mount()
+        return
+
+    service.mount(ReplayAdapter.from_file(args.replay, args.timing_scale))
+    results = run_virtual_clients(lambda _: scenario(service), args.clients)
+    errors = [r.error for r in results if r.error is not None]
+    seconds = sorted(r.seconds for r in results)
+    print(f'clients={len(results)} errors={len(errors)} '
+          f'median={statistics.median(seconds) * 1000:.1f}ms max={seconds[-1] * 1000:.1f}ms')
+    if errors:
+        print(f'first error: {errors[0]!r}')
+
+
+if __name__ == '__main__':
+    main()
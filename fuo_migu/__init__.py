@@ -7,10 +7,16 @@ __identifier__ = 'migu'
 
 from feeluown.app import App
 
+from fuo_migu.profiling import profiler
 from fuo_migu.provider import provider
+# projection 会导入 schema，schema 末尾导入 models，models 又导入 provider；
+# 若 provider 尚未导入，provider 末尾的 from fuo_migu.models import search 会遇到未初始化完的 models 而报错
+from fuo_migu import projection
 
 
 def enable(app):
+    profiler.configure_from_env()
+    projection.configure_from_env()
     app.library.register(provider)
     if app.mode & App.GuiMode:
         pm = app.pvd_uimgr.create_item(
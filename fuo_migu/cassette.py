@@ -0,0 +1,205 @@
+import base64
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+CASSETTE_VERSION = 1
+
+# 记录中保存的是解码后的响应体，这些头部回放时不再成立
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class CassetteError(requests.exceptions.RequestException):
+    pass
+
+
+def normalize_url(url: str) -> str:
+    """ 查询参数排序后作为匹配键，避免参数顺序影响回放 """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+
+class Interaction:
+    __slots__ = ('method', 'url', 'status', 'headers', 'body', 'elapsed')
+
+    def __init__(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes,
+                 elapsed: float = 0.0):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.method.upper(), normalize_url(self.url)
+
+    def to_dict(self) -> dict:
+        data = {
+            'method': self.method,
+            'url': self.url,
+            'status': self.status,
+            'headers': self.headers,
+            'elapsed': round(self.elapsed, 4),
+        }
+        try:
+            data['body'] = self.body.decode('utf-8')
+        except UnicodeDecodeError:
+            data['body_b64'] = base64.b64encode(self.body).decode('ascii')
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Interaction':
+        if 'body_b64' in data:
+            body = base64.b64decode(data['body_b64'])
+        else:
+            body = data.get('body', '').encode('utf-8')
+        return cls(data['method'], data['url'], data['status'], data.get('headers', {}), body,
+                   data.get('elapsed', 0.0))
+
+    def dumps(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class Cassette:
+    """
+    请求/响应记录，保存为 gzip 压缩的 JSON Lines，首行为版本头。
+    文件可以由多个 gzip 成员拼接而成，录制时每条记录单独追加
+    """
+
+    def __init__(self, interactions: Optional[List[Interaction]] = None):
+        self.interactions: List[Interaction] = interactions or []
+
+    @classmethod
+    def load(cls, path) -> 'Cassette':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != CASSETTE_VERSION:
+                raise CassetteError(f'unsupported cassette version: {header.get("version")}')
+            return cls([Interaction.from_dict(json.loads(line)) for line in f if line.strip()])
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'version': CASSETTE_VERSION}) + '\n')
+            for interaction in self.interactions:
+                f.write(interaction.dumps())
+
+
+class RecordingAdapter(BaseAdapter):
+    """
+    转发请求到真实的传输层，并记录每一次请求和响应。
+    每条记录立即追加到文件，进程没有正常关闭时已经录制的部分也能回放；关闭时重新整理写入
+    """
+
+    def __init__(self, path, adapter: Optional[BaseAdapter] = None):
+        super().__init__()
+        self.path = path
+        self.cassette = Cassette()
+        self._adapter = adapter or HTTPAdapter()
+        self._lock = threading.Lock()
+        self.cassette.save(self.path)
+
+    def send(self, request, **kwargs):
+        response = self._adapter.send(request, **kwargs)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}
+        interaction = Interaction(request.method, request.url, response.status_code, headers,
+                                  response.content, response.elapsed.total_seconds())
+        with self._lock:
+            self.cassette.interactions.append(interaction)
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(interaction.dumps())
+        return response
+
+    def save(self):
+        with self._lock:
+            self.cassette.save(self.path)
+
+    def close(self):
+        self.save()
+        self._adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    从记录中回放响应。相同请求按记录顺序依次返回，用完后循环，便于多个虚拟客户端并发回放
+    :param timing_scale: None 表示不等待；1.0 按记录的耗时等待；0.5 表示两倍速
+    """
+
+    def __init__(self, cassette: Cassette, timing_scale: Optional[float] = None):
+        super().__init__()
+        self.timing_scale = timing_scale
+        self._interactions: Dict[Tuple[str, str], List[Interaction]] = {}
+        for interaction in cassette.interactions:
+            self._interactions.setdefault(interaction.key, []).append(interaction)
+        self._cursors: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, timing_scale: Optional[float] = None) -> 'ReplayAdapter':
+        return cls(Cassette.load(path), timing_scale)
+
+    def _next(self, key: Tuple[str, str]) -> Interaction:
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                raise CassetteError(f'no recorded response for {key[0]} {key[1]}')
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return interactions[cursor % len(interactions)]
+
+    def send(self, request, **kwargs):
+        interaction = self._next((request.method.upper(), normalize_url(request.url)))
+        if self.timing_scale:
+            time.sleep(interaction.elapsed * self.timing_scale)
+        response = requests.Response()
+        response.status_code = interaction.status
+        response.headers = CaseInsensitiveDict(interaction.headers)
+        response._content = interaction.body
+        response.url = request.url
+        response.request = request
+        response.reason = 'REPLAYED'
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def close(self):
+        pass
+
+
+class ClientResult:
+    __slots__ = ('client', 'seconds', 'result', 'error')
+
+    def __init__(self, client: int, seconds: float, result: Any = None, error: Optional[BaseException] = None):
+        self.client = client
+        self.seconds = seconds
+        self.result = result
+        self.error = error
+
+
+def run_virtual_clients(scenario: Callable[[int], Any], clients: int) -> List[ClientResult]:
+    """
+    并发运行多个虚拟客户端，通常与 ReplayAdapter 搭配做离线压测
+    :param scenario: 客户端要执行的操作，参数为客户端编号
+    :param clients: 客户端数量
+    :return: 每个客户端的耗时、结果或异常
+    """
+    def run(client: int) -> ClientResult:
+        start = time.perf_counter()
+        try:
+            result = scenario(client)
+        except BaseException as e:
+            return ClientResult(client, time.perf_counter() - start, error=e)
+        return ClientResult(client, time.perf_counter() - start, result=result)
+
+    with ThreadPoolExecutor(max_workers=clients, thread_name_prefix='migu-client') as executor:
+        return list(executor.map(run, range(clients)))
@@ -0,0 +1,257 @@
+import abc
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, List, Optional
+
+from fuo_migu.profiling import ProfileMode, SpanContext, profiler
+
+
+logger = logging.getLogger('migu')
+
+
+class BackendMode(Enum):
+    inline = 'inline'
+    thread = 'thread'
+    process = 'process'
+
+
+class ExecutionStats:
+    """ 执行统计，进程池模式下额外记录序列化的大小与耗时 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tasks = 0
+        self.compute_seconds = 0.0
+        self.pickle_bytes = 0
+        self.pickle_seconds = 0.0
+
+    def record(self, compute_seconds: float, pickle_bytes: int = 0, pickle_seconds: float = 0.0):
+        with self._lock:
+            self.tasks += 1
+            self.compute_seconds += compute_seconds
+            self.pickle_bytes += pickle_bytes
+            self.pickle_seconds += pickle_seconds
+
+    def reset(self):
+        with self._lock:
+            self.tasks = 0
+            self.compute_seconds = 0.0
+            self.pickle_bytes = 0
+            self.pickle_seconds = 0.0
+
+    def __repr__(self):
+        return f'<ExecutionStats tasks={self.tasks} compute={self.compute_seconds:.4f}s ' \
+               f'pickle={self.pickle_bytes}B/{self.pickle_seconds:.4f}s>'
+
+
+class Backend(abc.ABC):
+    """
+    解析与 model 构造的执行后端。run/map 会阻塞调用方直到结果返回，
+    不希望阻塞调用方（如 GUI 线程）时使用 submit/map_async 返回的 Future
+    """
+    mode: BackendMode = None
+
+    def __init__(self):
+        self.stats = ExecutionStats()
+
+    @abc.abstractmethod
+    def submit(self, fn: Callable, *args) -> Future:
+        ...
+
+    def run(self, fn: Callable, *args) -> Any:
+        return self.submit(fn, *args).result()
+
+    def map_async(self, fn: Callable, items: List, chunk_size: int = 200) -> Future:
+        """ 按块提交，减少任务调度与序列化的次数；所有块完成后 Future 的结果为按顺序合并的列表 """
+        futures = [self.submit(_apply_chunk, fn, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)]
+        result = Future()
+        remaining = len(futures)
+        lock = threading.Lock()
+
+        def done(_):
+            nonlocal remaining
+            with lock:
+                remaining -= 1
+                if remaining:
+                    return
+            try:
+                merged = [item for future in futures for item in future.result()]
+            except BaseException as e:
+                result.set_exception(e)
+            else:
+                result.set_result(merged)
+
+        if not futures:
+            return completed([])
+        for future in futures:
+            future.add_done_callback(done)
+        return result
+
+    def map(self, fn: Callable, items: List, chunk_size: int = 200) -> List:
+        return self.map_async(fn, items, chunk_size).result()
+
+    def shutdown(self):
+        pass
+
+
+class InlineBackend(Backend):
+    mode = BackendMode.inline
+
+    def submit(self, fn: Callable, *args) -> Future:
+        future = Future()
+        start = time.perf_counter()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        self.stats.record(time.perf_counter() - start)
+        return future
+
+
+class ThreadBackend(Backend):
+    mode = BackendMode.thread
+
+    def __init__(self, max_workers: Optional[int] = None):
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='migu-hydrate')
+
+    def _timed(self, context: Optional[SpanContext], fn: Callable, *args):
+        start = time.perf_counter()
+        try:
+            with profiler.attach(context, 'backend.thread'):
+                return fn(*args)
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        # 工作线程中的区段接到提交任务时所在的区段之下
+        return self._executor.submit(self._timed, profiler.fork(), fn, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class ProcessBackend(Backend):
+    """ 进程池后端，参数和结果都需要序列化，统计中的 pickle 开销即为额外成本 """
+    mode = BackendMode.process
+
+    def __init__(self, max_workers: Optional[int] = None):
+        super().__init__()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        # 子进程的调用栈无法被本进程采样，只在 spans 模式下收集子进程的区段
+        context = profiler.fork() if profiler.mode == ProfileMode.spans else None
+        start = time.perf_counter()
+        payload = pickle.dumps((fn, args, context), protocol=pickle.HIGHEST_PROTOCOL)
+        dumps_seconds = time.perf_counter() - start
+        inner = self._executor.submit(_run_pickled, payload)
+        future = Future()
+
+        def done(f: Future):
+            try:
+                data, compute_seconds, worker_pickle_seconds, profile = f.result()
+                start_loads = time.perf_counter()
+                result = pickle.loads(data)
+                loads_seconds = time.perf_counter() - start_loads
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            self.stats.record(compute_seconds, len(payload) + len(data),
+                              dumps_seconds + worker_pickle_seconds + loads_seconds)
+            if profile is not None:
+                # 子进程中的区段统计并入本进程
+                spans, stacks = profile
+                profiler.merge(spans, stacks)
+                context.join(spans['backend.process'][1])
+            future.set_result(result)
+
+        inner.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _apply_chunk(fn: Callable, items: List) -> List:
+    return [fn(item) for item in items]
+
+
+def _run_pickled(payload: bytes):
+    fn, args, context = pickle.loads(payload)
+    if context is not None:
+        profiler.reset()
+        profiler.enable(ProfileMode.spans)
+    try:
+        start = time.perf_counter()
+        with profiler.attach(context, 'backend.process'):
+            result = fn(*args)
+        compute_seconds = time.perf_counter() - start
+        profile = profiler.export() if context is not None else None
+    finally:
+        if context is not None:
+            profiler.disable()
+            profiler.reset()
+    start = time.perf_counter()
+    data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    return data, compute_seconds, time.perf_counter() - start, profile
+
+
+def completed(value: Any) -> Future:
+    """ 已经得到结果的 Future，用于命中缓存等不需要执行任务的情况 """
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def chain(future: Future, fn: Callable[[Any], Future]) -> Future:
+    """ future 完成后以其结果调用 fn，返回的 Future 跟随 fn 返回的 Future 完成，全程不阻塞 """
+    result = Future()
+
+    def copy(f: Future):
+        if result.cancelled():
+            return
+        if f.cancelled():
+            result.cancel()
+        elif f.exception() is not None:
+            result.set_exception(f.exception())
+        else:
+            result.set_result(f.result())
+
+    def then(f: Future):
+        if result.cancelled() or f.cancelled() or f.exception() is not None:
+            copy(f)
+            return
+        try:
+            fn(f.result()).add_done_callback(copy)
+        except BaseException as e:
+            result.set_exception(e)
+
+    future.add_done_callback(then)
+    return result
+
+
+def create_backend(mode: BackendMode, max_workers: Optional[int] = None) -> Backend:
+    """
+    根据模式创建执行后端
+    :param mode: 执行模式（枚举）
+    :type mode: BackendMode
+    :param max_workers: 线程池/进程池大小，inline 模式忽略
+    :rtype: Backend
+    """
+    if mode == BackendMode.inline:
+        return InlineBackend()
+    if mode == BackendMode.thread:
+        return ThreadBackend(max_workers)
+    if mode == BackendMode.process:
+        return ProcessBackend(max_workers)
+    raise ValueError(f'unsupported backend mode: {mode}')
+
+
+def to_model(schema):
+    """ 供 Backend.map 使用的 model 构造函数，需要是模块级函数才能被序列化 """
+    return schema.model()
@@ -1,10 +1,15 @@
+from concurrent.futures import Future
+from typing import Optional
+
 from fuocore.media import Media
 from fuocore.models import SearchType as FuoSearchType, BaseModel, SearchModel, SongModel, ArtistModel, \
     AlbumModel, PlaylistModel, MvModel, VideoModel, LyricModel  # noqa
 from fuocore.reader import SequentialReader
 
+from fuo_migu.executor import chain, completed
+from fuo_migu.mv import MvResolver
 from fuo_migu.provider import provider
-from fuo_migu.schema import SearchType
+from fuo_migu.schema import MV_QUALITIES, SearchType
 from fuo_migu.service import MiguService
 
 
@@ -23,21 +28,30 @@ FORMATS = {
 }
 
 
+def fetch_models(func, *args) -> Future:
+    """ 在后台请求列表并构造 model，返回的 Future 结果为 model 列表 """
+    return chain(provider.api.run_async(func, *args),
+                 lambda data: provider.api.hydrate_async(data.result.results))
+
+
 def create_g(func, identifier):
     data = func(identifier, page=1, page_size=30)
     total = data.result.total_count
 
     def g():
-        nonlocal data
         if data is None:
             yield from ()
-        else:
-            page = 1
-            while data.result.results:
-                for schema in data.result.results:
-                    yield schema.model()
-                page += 1
-                data = func(identifier, page=page, page_size=30)
+            return
+        models = provider.api.hydrate_async(data.result.results)
+        page = 1
+        while True:
+            items = models.result()
+            if not items:
+                break
+            page += 1
+            # 消费当前页时，下一页已经在后台请求和构造
+            models = fetch_models(func, identifier, page, 30)
+            yield from items
 
     return SequentialReader(g(), total)
 
@@ -76,8 +90,8 @@ class MiguSongModel(SongModel, MiguBaseModel):
         if not self.has_mv:
             return None
         if self.cached_mv is None:
-            result = provider.api.mv_detail(self.mv_cpid)
-            self.cached_mv = result.data.model() if result.data is not None else None
+            detail = MvResolver().resolve(self.mv_cpid)
+            self.cached_mv = detail.model(self.mv_cpid) if detail is not None else None
         return self.cached_mv
 
     @mv.setter
@@ -86,7 +100,10 @@ class MiguSongModel(SongModel, MiguBaseModel):
 
 
 class MiguArtistModel(ArtistModel, MiguBaseModel):
-    pass
+    def list_related(self, limit=10):
+        """ 相关歌手，只读取本地的关系图，不发起请求 """
+        return [MiguArtistModel(identifier=id_, name=name)
+                for id_, name in provider.api.artist_graph.related(self.identifier, limit)]
 
 
 class MiguAlbumModel(AlbumModel, MiguBaseModel):
@@ -97,19 +114,32 @@ class MiguAlbumModel(AlbumModel, MiguBaseModel):
     @classmethod
     def get(cls, identifier):
         result = provider.api.album_detail(identifier)
-        return result.data.model()
+        return provider.api.revalidation.model(result, result.data.model)
 
     @property
     def songs(self):
         if self.cached_songs is None:
             result = provider.api.album_songs(self.identifier, 1, 30)
-            self.cached_songs = [o.model() for o in result.result.results]
+            self.cached_songs = provider.api.hydrate_async(result.result.results).result()
         return self.cached_songs
 
     @songs.setter
     def songs(self, _):
         pass
 
+    def songs_async(self) -> Future:
+        """ 不阻塞调用方的 songs，完成后同样写入缓存 """
+        if self.cached_songs is not None:
+            return completed(self.cached_songs)
+
+        def done(f: Future):
+            if not f.cancelled() and f.exception() is None:
+                self.cached_songs = f.result()
+
+        future = fetch_models(provider.api.album_songs, self.identifier, 1, 30)
+        future.add_done_callback(done)
+        return future
+
 
 class MiguPlaylistModel(PlaylistModel, MiguBaseModel):
     pass
@@ -119,13 +149,63 @@ class MiguSearchModel(SearchModel, MiguBaseModel):
     pass
 
 
+def resolve_media(cpid: str, quality: Optional[str] = None) -> Optional[Media]:
+    """ 播放地址带签名会过期，每次都从解析缓存中取，缓存过期后重新请求 """
+    detail = MvResolver().resolve(cpid)
+    variant = detail.select(quality=quality) if detail is not None else None
+    return Media(variant.url) if variant is not None else None
+
+
 class MiguMvModel(MvModel, MiguBaseModel):
+    """ identifier 为 mv_copyright_id，与 MV 详情中的 copyrightId 不同 """
+
     class Meta:
-        fields_no_get = ['cover', 'artist']
+        fields = ['variants']
+        fields_no_get = ['cover', 'artist', 'variants', 'media']
+        support_multi_quality = True
+
+    @classmethod
+    def get(cls, identifier):
+        """ :param identifier: mv_copyright_id """
+        detail = MvResolver().resolve(identifier)
+        return detail.model(identifier) if detail is not None else None
+
+    def list_quality(self):
+        qualities = {v.quality for v in self.variants or [] if v.quality in MV_QUALITIES}
+        return [quality for quality in MV_QUALITIES if quality in qualities]
+
+    def get_media(self, quality):
+        return resolve_media(self.identifier, quality)
+
+    @property
+    def media(self):
+        return resolve_media(self.identifier)
+
+    @media.setter
+    def media(self, _):
+        pass
 
 
 class MiguVideoModel(VideoModel, MiguBaseModel):
-    pass
+    """ identifier 为 mv_copyright_id """
+
+    class Meta:
+        fields_no_get = ['cover', 'media']
+
+    @classmethod
+    def get(cls, identifier):
+        detail = MvResolver().resolve(identifier)
+        if detail is None:
+            return None
+        return cls(identifier=identifier, title=detail.content_name)
+
+    @property
+    def media(self):
+        return resolve_media(self.identifier)
+
+    @media.setter
+    def media(self, _):
+        pass
 
 
 class MiguLyricModel(LyricModel, MiguBaseModel):
@@ -156,6 +236,9 @@ def search_by_type(keyword: str, stype: SearchType):
         raise MiguModelException('field not found')
     for item in getattr(data, field):
         items.append(item.model())
+    if stype == SearchType.mv:
+        # 搜索结果中的 MV 不含播放地址，后台批量解析
+        MvResolver().prefetch((item.identifier for item in items), group=('search', keyword))
     return MiguSearchModel(**{rfield: items})
 
 
@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from fuo_migu.executor import completed
+from fuo_migu.scheduler import Lane
+from fuo_migu.util import Singleton
+
+
+logger = logging.getLogger('migu')
+
+
+class MvResolver(metaclass=Singleton):
+    """ MV 详情解析，按 mv_copyright_id 缓存，播放地址带签名，过期后重新请求 """
+    TTL = 30 * 60
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[float, Optional['MvDetail']]] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, cpid: str) -> Tuple[bool, Optional['MvDetail']]:
+        entry = self._cache.get(cpid)
+        if entry is None:
+            return False, None
+        expire_at, detail = entry
+        if expire_at <= time.monotonic():
+            self._cache.pop(cpid, None)
+            return False, None
+        return True, detail
+
+    def _fetch(self, cpid: str) -> Optional['MvDetail']:
+        detail = MiguService().mv_detail(cpid).data
+        with self._lock:
+            self._cache[cpid] = (time.monotonic() + self.TTL, detail)
+        return detail
+
+    def _submit(self, cpid: str, lane: Lane, group: Optional[Hashable] = None) -> Future:
+        with self._lock:
+            hit, detail = self._lookup(cpid)
+            if hit:
+                return completed(detail)
+            pending = self._pending.get(cpid)
+        if pending is None:
+            # 提交和注册回调都不能持有 _lock：任务很快失败时回调会在当前线程中直接执行
+            future = MiguService().scheduler.submit(self._fetch, cpid, lane=lane, group=group)
+            with self._lock:
+                pending = self._pending.get(cpid)
+                if pending is None:
+                    self._pending[cpid] = future
+            if pending is None:
+                future.add_done_callback(lambda f: self._forget(cpid, f))
+                return future
+            # 其他线程抢先提交了同一个请求
+            future.cancel()
+        # 已经在预取队列中，按调用方的通道提升优先级
+        MiguService().scheduler.promote(pending, lane)
+        return pending
+
+    def _forget(self, cpid: str, future: Future):
+        with self._lock:
+            if self._pending.get(cpid) is future:
+                self._pending.pop(cpid)
+
+    def resolve(self, cpid: str) -> Optional['MvDetail']:
+        """
+        获取 MV 详情，命中缓存时不发起请求。
+        请求在调用方线程以可见通道发起，不在后台队列中排在预取任务之后
+        :param cpid: mv_copyright_id
+        :return: MV 详情，无 MV 时返回 None
+        :rtype: Optional[MvDetail]
+        """
+        while True:
+            with self._lock:
+                hit, detail = self._lookup(cpid)
+                if hit:
+                    return detail
+                pending = self._pending.get(cpid)
+                if pending is None:
+                    future = self._pending[cpid] = Future()
+                    future.set_running_or_notify_cancel()
+                    break
+            # 还在排队的预取直接取消，改为自己请求；已经开始的则提升优先级后等待
+            if not pending.cancel():
+                MiguService().scheduler.promote(pending, Lane.visible)
+                try:
+                    return pending.result()
+                except CancelledError:
+                    pass
+        try:
+            with MiguService().scheduler.context(Lane.visible):
+                detail = self._fetch(cpid)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(detail)
+            return detail
+        finally:
+            self._forget(cpid, future)
+
+    def resolve_many(self, cpids: Iterable[str]) -> Dict[str, Optional['MvDetail']]:
+        """
+        批量获取 MV 详情，未缓存的部分并发请求，失败的条目不出现在结果中
+        :param cpids: mv_copyright_id 列表
+        :rtype: Dict[str, Optional[MvDetail]]
+        """
+        futures = {cpid: self._submit(cpid, Lane.visible) for cpid in dict.fromkeys(cpids) if cpid}
+        results = {}
+        for cpid, future in futures.items():
+            try:
+                results[cpid] = future.result()
+            except (MiguException, CancelledError) as e:
+                logger.warning(f'MV {cpid} resolve failed: {e}')
+        return results
+
+    def prefetch(self, cpids: Iterable[str], group: Optional[Hashable] = None):
+        """ 后台预取 MV 详情，不阻塞调用方，可以通过 MiguService().scheduler.cancel(group) 取消 """
+        for cpid in dict.fromkeys(cpids):
+            if cpid:
+                self._submit(cpid, Lane.prefetch, group)
+
+    def invalidate(self, cpid: Optional[str] = None):
+        with self._lock:
+            if cpid is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(cpid, None)
+
+
+from fuo_migu.schema import MvDetail  # noqa: E402
+from fuo_migu.service import MiguService, MiguException  # noqa: E402
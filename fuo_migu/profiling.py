@@ -0,0 +1,341 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger('migu')
+
+
+class ProfileMode(Enum):
+    off = 'off'
+    spans = 'spans'  # 确定性计时，记录每个区段的耗时
+    sampling = 'sampling'  # 只定时采样所有线程的调用栈，区段仅作标注，不计时，开销低于 spans
+
+
+class SpanStats:
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, count: int, total: float, min_: float, max_: float):
+        self.count += count
+        self.total += total
+        self.min = min(self.min, min_)
+        self.max = max(self.max, max_)
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'min_ms': round(self.min * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _NameSpan:
+    """ sampling 模式下的区段，只维护名字栈供采样标注，不计时也不加锁 """
+    __slots__ = ('profiler', 'name')
+    elapsed = 0.0
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._stack().pop()
+        return False
+
+
+class SpanContext:
+    """
+    提交任务时调用方所在的区段，在其他线程或进程中执行的区段据此接到调用方的路径之下。
+    parent 只在同一进程内有效，序列化时丢弃
+    """
+    __slots__ = ('path', 'parent')
+
+    def __init__(self, path: List[str], parent: Optional['_Span']):
+        self.path = path
+        self.parent = parent
+
+    def join(self, seconds: float):
+        """ 任务的耗时计入调用方区段的子区段，不再算作调用方自身的耗时 """
+        if self.parent is not None:
+            with self.parent.profiler._lock:
+                self.parent.children += seconds
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, state):
+        self.path = state
+        self.parent = None
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start', 'children', 'elapsed')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.children = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = self.elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        path = ';'.join(self.profiler._prefix() + [s.name for s in stack])
+        stack.pop()
+        if stack:
+            stack[-1].children += elapsed
+        self.profiler._record(self.name, path, elapsed, elapsed - self.children)
+        return False
+
+
+class Profiler:
+    """
+    热点路径的性能分析，默认关闭。spans 模式记录每个区段的耗时；
+    sampling 模式不计时，后台线程定时采样所有线程（包括 GUI 线程）的调用栈，区段名只用于标注采样所在的区段。
+    结果可导出为 collapsed stack（可直接用 flamegraph.pl / speedscope 打开）与区段汇总。
+    执行后端通过 fork/attach 把工作线程和子进程中的区段接到调用方的区段之下，子进程的统计随结果返回后合并
+    """
+    SAMPLE_INTERVAL = 0.005
+
+    def __init__(self):
+        self.mode = ProfileMode.off
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active: Dict[int, List[_Span]] = {}
+        self._spans: Dict[str, SpanStats] = {}
+        self._stacks: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != ProfileMode.off
+
+    def enable(self, mode: ProfileMode = ProfileMode.spans, interval: Optional[float] = None):
+        self.disable()
+        self.mode = mode
+        if mode == ProfileMode.sampling:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, args=(interval or self.SAMPLE_INTERVAL,),
+                                             name='migu-profiler', daemon=True)
+            self._sampler.start()
+
+    def disable(self):
+        self.mode = ProfileMode.off
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._stacks.clear()
+            self._samples.clear()
+
+    def span(self, name: str):
+        """ 区段上下文管理器，关闭时几乎没有开销 """
+        if self.mode == ProfileMode.off:
+            return _NULL_SPAN
+        if self.mode == ProfileMode.sampling:
+            return _NameSpan(self, name)
+        return _Span(self, name)
+
+    def fork(self) -> Optional[SpanContext]:
+        """ 记录当前线程的区段路径，供交给其他线程/进程的任务使用；关闭时返回 None """
+        if self.mode == ProfileMode.off:
+            return None
+        stack = self._stack()
+        return SpanContext(self._prefix() + [s.name for s in stack], stack[-1] if stack else None)
+
+    @contextmanager
+    def attach(self, context: Optional[SpanContext], name: str):
+        """
+        在调用方的区段路径下执行，name 为表示这次转移的区段，其自身耗时即排队、序列化等额外开销
+        :param context: fork 的返回值
+        """
+        if context is None or self.mode == ProfileMode.off:
+            yield None
+            return
+        old = getattr(self._local, 'prefix', None)
+        self._local.prefix = context.path
+        if self.mode == ProfileMode.sampling:
+            # 采样线程看不到其他线程的 prefix，直接把调用方路径写进名字
+            span = _NameSpan(self, ';'.join(context.path + [name]))
+        else:
+            span = _Span(self, name)
+        try:
+            with span:
+                yield span
+        finally:
+            self._local.prefix = old
+            context.join(span.elapsed)
+
+    def export(self) -> Tuple[Dict[str, tuple], Dict[str, float]]:
+        """ 导出区段统计，供子进程把结果交还给主进程 """
+        with self._lock:
+            spans = {name: (st.count, st.total, st.min, st.max) for name, st in self._spans.items()}
+            return spans, dict(self._stacks)
+
+    def merge(self, spans: Dict[str, tuple], stacks: Dict[str, float]):
+        """ 合并 export 导出的统计 """
+        with self._lock:
+            for name, values in spans.items():
+                stats = self._spans.get(name)
+                if stats is None:
+                    stats = self._spans[name] = SpanStats()
+                stats.merge(*values)
+            for path, seconds in stacks.items():
+                self._stacks[path] = self._stacks.get(path, 0.0) + seconds
+
+    def _prefix(self) -> List[str]:
+        return getattr(self._local, 'prefix', None) or []
+
+    def _stack(self) -> List[_Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            with self._lock:
+                self._active[threading.get_ident()] = stack
+        return stack
+
+    def _record(self, name: str, path: str, elapsed: float, self_time: float):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = SpanStats()
+            stats.add(elapsed)
+            self._stacks[path] = self._stacks.get(path, 0.0) + self_time
+
+    def _sample_loop(self, interval: float):
+        own = threading.get_ident()
+        while not self._stop.wait(interval):
+            frames = sys._current_frames()
+            threads = {t.ident: t.name for t in threading.enumerate()}
+            with self._lock:
+                active = {tid: [s.name for s in stack] for tid, stack in self._active.items() if stack}
+            for tid, frame in frames.items():
+                if tid == own:
+                    continue
+                # 以线程名为根，区段之外的耗时同样可见
+                names = [threads.get(tid, str(tid))] + active.get(tid, [])
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    calls.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                key = ';'.join(names + calls[::-1])
+                with self._lock:
+                    self._samples[key] = self._samples.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            items = sorted(self._spans.items(), key=lambda kv: kv[1].total, reverse=True)
+            return {name: stats.to_dict() for name, stats in items}
+
+    def dump(self, directory) -> List[Path]:
+        """
+        导出分析结果
+        :param directory: 输出目录
+        :return: spans.collapsed（区段自身耗时，单位微秒）、samples.collapsed（采样次数）与 summary.json
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            stacks = dict(self._stacks)
+            samples = dict(self._samples)
+        paths = []
+        path = directory / 'spans.collapsed'
+        path.write_text(''.join(f'{k} {max(int(v * 1e6), 1)}\n' for k, v in stacks.items()), encoding='utf-8')
+        paths.append(path)
+        if samples:
+            path = directory / 'samples.collapsed'
+            path.write_text(''.join(f'{k} {v}\n' for k, v in samples.items()), encoding='utf-8')
+            paths.append(path)
+        path = directory / 'summary.json'
+        path.write_text(json.dumps(self.summary(), ensure_ascii=False, indent=2), encoding='utf-8')
+        paths.append(path)
+        return paths
+
+    def configure_from_env(self):
+        """
+        通过环境变量开启：FUO_MIGU_PROFILE=spans|sampling，
+        FUO_MIGU_PROFILE_DIR 指定退出时导出结果的目录
+        """
+        value = os.environ.get('FUO_MIGU_PROFILE')
+        if not value:
+            return
+        try:
+            mode = ProfileMode(value)
+        except ValueError:
+            logger.warning(f'unknown profile mode: {value}')
+            return
+        self.enable(mode)
+        directory = os.environ.get('FUO_MIGU_PROFILE_DIR')
+        if directory and mode != ProfileMode.off:
+            atexit.register(self.dump, directory)
+
+
+profiler = Profiler()
+
+
+def profiled(name: str) -> Callable:
+    """ 将函数调用记录为一个区段 """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if profiler.mode == ProfileMode.off:
+                return func(*args, **kwargs)
+            with profiler.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
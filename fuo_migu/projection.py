@@ -0,0 +1,331 @@
+import ast
+import atexit
+import inspect
+import json
+import logging
+import os
+import textwrap
+import threading
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Type
+
+from pydantic import BaseModel
+from pydantic.datetime_parse import parse_date
+from pydantic.fields import ModelField, SHAPE_LIST, SHAPE_SINGLETON
+
+from fuo_migu.schema import BaseSchema, PROJECTIONS, SongSearchResult, ArtistSearchResult, AlbumSearchResult, \
+    PlaylistSearchResult, MvSearchResult, SongDetailResult, ArtistDetailResult, ArtistSongsResult, AlbumDetailResult, \
+    PlaylistDetailResult, PlaylistSongsResult, AlbumSongsResult, MvDetailResult
+
+
+logger = logging.getLogger('migu')
+
+RESULT_TYPES = (SongSearchResult, ArtistSearchResult, AlbumSearchResult, PlaylistSearchResult, MvSearchResult,
+                SongDetailResult, ArtistDetailResult, ArtistSongsResult, AlbumDetailResult, PlaylistDetailResult,
+                PlaylistSongsResult, AlbumSongsResult, MvDetailResult)
+
+_TRUE = {'1', 'on', 't', 'true', 'y', 'yes'}
+_FALSE = {'0', 'off', 'f', 'false', 'n', 'no'}
+
+
+class SchemaDrift(Exception):
+    """ 响应结构与 schema 声明不符，需要回退到完整校验 """
+
+
+class FieldUsage:
+    """
+    统计 schema 字段被读取的次数。开启后替换 BaseSchema.__getattribute__，
+    因此只适合在调试或采集阶段开启，关闭后没有任何额外开销
+    """
+
+    def __init__(self):
+        self.reads: Dict[str, Counter] = {}
+        self.declared: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return '__getattribute__' in BaseSchema.__dict__
+
+    def enable(self):
+        reads, declared, lock = self.reads, self.declared, self._lock
+
+        def __getattribute__(obj, name):
+            value = object.__getattribute__(obj, name)
+            cls = type(obj)
+            if name in cls.__fields__:
+                key = cls.__qualname__
+                with lock:
+                    counter = reads.get(key)
+                    if counter is None:
+                        counter = reads[key] = Counter()
+                        declared[key] = set(cls.__fields__)
+                    counter[name] += 1
+            return value
+
+        BaseSchema.__getattribute__ = __getattribute__
+
+    def disable(self):
+        if self.enabled:
+            del BaseSchema.__getattribute__
+
+    def observe(self, result_type: Type[BaseSchema]):
+        """ 登记某个结果类型下的所有 schema，没有被读取过的也会出现在统计中 """
+        for cls in _schema_types(result_type):
+            with self._lock:
+                self.declared.setdefault(cls.__qualname__, set(cls.__fields__))
+                self.reads.setdefault(cls.__qualname__, Counter())
+
+    def used(self) -> Dict[str, Set[str]]:
+        with self._lock:
+            return {key: set(counter) for key, counter in self.reads.items()}
+
+    def dump(self, path):
+        with self._lock:
+            data = {
+                key: {
+                    'read': dict(self.reads.get(key, {})),
+                    'unused': sorted(declared - set(self.reads.get(key, {}))),
+                }
+                for key, declared in sorted(self.declared.items())
+            }
+        Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    @staticmethod
+    def load(path) -> Dict[str, Set[str]]:
+        """ 读取 dump 的统计，返回每个 schema 被读取过的字段 """
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+        return {key: set(value['read']) for key, value in data.items()}
+
+
+field_usage = FieldUsage()
+
+
+def _schema_types(cls: Type[BaseSchema], seen: Optional[Set[type]] = None) -> Iterable[Type[BaseSchema]]:
+    seen = set() if seen is None else seen
+    if cls in seen:
+        return
+    seen.add(cls)
+    yield cls
+    for field in cls.__fields__.values():
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            yield from _schema_types(field.type_, seen)
+
+
+def _attr_chain(node: ast.AST) -> Optional[tuple]:
+    """ name.a.b 形式的属性访问，返回 ('name', ['a', 'b']) """
+    names = []
+    while isinstance(node, ast.Attribute):
+        names.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        return node.id, names[::-1]
+    return None
+
+
+def _is_schema(type_) -> bool:
+    return isinstance(type_, type) and issubclass(type_, BaseSchema)
+
+
+def _record_chain(owner: Type[BaseSchema], names: List[str], reads: Dict[str, Set[str]]) -> Optional[type]:
+    """ 沿属性链记录读取的字段，返回链末端的 schema 类型 """
+    for name in names:
+        field = owner.__fields__.get(name)
+        if field is None:
+            return None
+        reads.setdefault(owner.__qualname__, set()).add(name)
+        owner = field.type_
+        if not _is_schema(owner):
+            return None
+    return owner
+
+
+def _method_reads(cls: Type[BaseSchema]) -> Dict[str, Set[str]]:
+    """
+    从 schema 自身的方法（model、属性等）的源码中找出读取的字段，包括 self.a.b 形式的嵌套字段，
+    以及 for x in self.items 循环变量上读取的字段。
+    这些字段即使在统计中没有出现也要解码，否则 model() 会拿到 None
+    """
+    reads: Dict[str, Set[str]] = {}
+    for klass in cls.__mro__:
+        if not issubclass(klass, BaseSchema) or klass is BaseSchema:
+            continue
+        for attr in vars(klass).values():
+            fn = attr.fget if isinstance(attr, property) else attr
+            fn = inspect.unwrap(fn) if callable(fn) else fn
+            if not inspect.isfunction(fn):
+                continue
+            try:
+                tree = ast.parse(textwrap.dedent(inspect.getsource(fn)))
+            except (OSError, TypeError, SyntaxError):
+                continue
+            bindings = {'self': cls}
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.For, ast.comprehension)) and isinstance(node.target, ast.Name):
+                    chain = _attr_chain(node.iter)
+                    if chain is not None and chain[0] == 'self':
+                        item = _record_chain(cls, chain[1], reads)
+                        if item is not None:
+                            bindings[node.target.id] = item
+            for node in ast.walk(tree):
+                chain = _attr_chain(node)
+                if chain is not None and chain[0] in bindings:
+                    _record_chain(bindings[chain[0]], chain[1], reads)
+    return reads
+
+
+def seed_fields(result_type: Type[BaseSchema], used: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """ 在统计结果中补上 schema 方法读取的字段；统计中没有的 schema 本来就保留全部字段，不需要补 """
+    seeded = {key: set(names) for key, names in used.items()}
+    for cls in _schema_types(result_type):
+        for key, names in _method_reads(cls).items():
+            if key in seeded:
+                seeded[key] |= names
+    return seeded
+
+
+def _to_str(v):
+    if isinstance(v, str):
+        return v
+    if isinstance(v, (int, float)):
+        return str(v)
+    raise SchemaDrift(f'expect str, got {type(v).__name__}')
+
+
+def _to_int(v):
+    if type(v) is int:
+        return v
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        raise SchemaDrift(f'expect int, got {v!r}') from None
+
+
+def _to_bool(v):
+    if v is True or v is False:
+        return v
+    if v in (0, 1):
+        return bool(v)
+    if isinstance(v, str):
+        lowered = v.lower()
+        if lowered in _TRUE:
+            return True
+        if lowered in _FALSE:
+            return False
+    raise SchemaDrift(f'expect bool, got {v!r}')
+
+
+def _to_date(v):
+    try:
+        return parse_date(v)
+    except (TypeError, ValueError):
+        raise SchemaDrift(f'expect date, got {v!r}') from None
+
+
+def _to_dict(v):
+    if isinstance(v, dict):
+        return v
+    raise SchemaDrift(f'expect dict, got {type(v).__name__}')
+
+
+SCALARS = {str: _to_str, int: _to_int, bool: _to_bool, date: _to_date, dict: _to_dict}
+
+
+def _field_converter(cls: Type[BaseSchema], field: ModelField, used: Dict[str, Set[str]]) -> Callable[[Any], Any]:
+    type_ = field.type_
+    if isinstance(type_, type) and issubclass(type_, BaseSchema):
+        item = _compile(type_, used)
+    elif type_ in SCALARS:
+        item = SCALARS[type_]
+    else:
+        def item(v):
+            value, errors = field.validate(v, {}, loc=field.name, cls=cls)
+            if errors:
+                raise SchemaDrift(f'{cls.__qualname__}.{field.name}: invalid value')
+            return value
+
+        return item
+
+    if field.shape == SHAPE_SINGLETON:
+        return item
+    if field.shape == SHAPE_LIST:
+        def convert_list(v):
+            if not isinstance(v, list):
+                raise SchemaDrift(f'{cls.__qualname__}.{field.name}: expect list')
+            if None in v:
+                raise SchemaDrift(f'{cls.__qualname__}.{field.name}: null item')
+            return [item(x) for x in v]
+
+        return convert_list
+    raise TypeError(f'unsupported field shape: {cls.__qualname__}.{field.name}')
+
+
+def _compile(cls: Type[BaseSchema], used: Dict[str, Set[str]]) -> Callable[[Any], BaseSchema]:
+    names = used.get(cls.__qualname__)
+    # 没有统计到的 schema 保留全部字段
+    fields = [f for name, f in cls.__fields__.items() if names is None or name in names]
+    plan = [(f.name, f.alias, _field_converter(cls, f, used)) for f in fields]
+    fields_set = {name for name, _, _ in plan}
+
+    def parse(raw):
+        if not isinstance(raw, dict):
+            raise SchemaDrift(f'{cls.__qualname__}: expect object, got {type(raw).__name__}')
+        values = {}
+        for name, alias, convert in plan:
+            v = raw.get(alias)
+            values[name] = None if v is None else convert(v)
+        return cls.construct(_fields_set=set(fields_set), **values)
+
+    return parse
+
+
+class ProjectionParser:
+    """
+    只解码统计中被读取过的字段以及 schema 方法中读取的字段，跳过 pydantic 的完整校验；
+    遇到与声明不符的结构时回退到 parse_obj，保证结果与原来一致。
+    其余字段为 None，schema 之外的代码读取的字段需要由字段统计覆盖
+    """
+
+    def __init__(self, result_type: Type[BaseSchema], used: Dict[str, Set[str]]):
+        self.result_type = result_type
+        self.fallbacks = 0
+        self._parse = _compile(result_type, seed_fields(result_type, used))
+
+    def __call__(self, data) -> BaseSchema:
+        try:
+            return self._parse(data)
+        except SchemaDrift as e:
+            self.fallbacks += 1
+            logger.debug(f'{self.result_type.__name__} fallback to full validation: {e}')
+            return self.result_type.parse_obj(data)
+
+
+def enable_projection(used: Dict[str, Set[str]], result_types: Iterable[Type[BaseSchema]] = RESULT_TYPES):
+    """ 为结果类型启用投影解析，parse_content 会优先使用它们 """
+    for result_type in result_types:
+        PROJECTIONS[result_type] = ProjectionParser(result_type, used)
+
+
+def disable_projection():
+    PROJECTIONS.clear()
+
+
+def configure_from_env():
+    """
+    FUO_MIGU_FIELD_USAGE=<path>：统计字段读取情况，退出时写入该文件；
+    FUO_MIGU_PROJECTION=<path>：根据该统计文件启用投影解析
+    """
+    usage_path = os.environ.get('FUO_MIGU_FIELD_USAGE')
+    if usage_path:
+        for result_type in RESULT_TYPES:
+            field_usage.observe(result_type)
+        field_usage.enable()
+        atexit.register(field_usage.dump, usage_path)
+    projection_path = os.environ.get('FUO_MIGU_PROJECTION')
+    if projection_path:
+        try:
+            enable_projection(FieldUsage.load(projection_path))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f'projection disabled, invalid field usage file: {e}')
@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+from feeluown.consts import DATA_DIR
+
+from fuo_migu.scheduler import Lane
+
+
+logger = logging.getLogger('migu')
+
+GRAPH_VERSION = 1
+
+
+def normalize_name(name: str) -> str:
+    return name.strip().casefold()
+
+
+class ArtistGraph:
+    """
+    相似歌手关系图。歌手详情中的相似歌手只有名字，通过（带缓存的）搜索解析为 id，
+    邻接表保存在本地，随着歌手详情的获取逐步补全，查询相关歌手时不再需要联网
+    """
+    # 搜索不到的名字过一段时间再重试
+    MISS_TTL = 7 * 24 * 3600
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.path.join(DATA_DIR, 'migu', 'artist_graph.json'))
+        self._artists: Dict[str, dict] = {}
+        self._names: Dict[str, Tuple[Optional[str], float]] = {}
+        self._out: Dict[str, List[str]] = {}
+        self._in: Dict[str, Set[str]] = {}
+        self._display: Dict[str, str] = {}
+        # 名字 -> 将其列为相似歌手的歌手，名字解析后只需重新计算这些歌手的出边
+        self._mentions: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._resolving: Optional[Future] = None
+        self._saving: Optional[Future] = None
+        self._dirty = False
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning(f'artist graph load failed: {e}')
+            return
+        if data.get('version') != GRAPH_VERSION:
+            return
+        self._artists = data.get('artists', {})
+        self._names = {k: tuple(v) for k, v in data.get('names', {}).items()}
+        for aid, artist in self._artists.items():
+            self._display[aid] = artist['name']
+            self._mention(aid, artist['similar_names'])
+        for aid in self._artists:
+            self._reindex(aid)
+
+    def save(self):
+        with self._lock:
+            data = {'version': GRAPH_VERSION, 'artists': self._artists,
+                    'names': {k: list(v) for k, v in self._names.items()}}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(',', ':')), encoding='utf-8')
+            os.replace(tmp, self.path)
+
+    def _schedule_save(self):
+        """ 在调度器的预取通道中保存，不阻塞调用方；保存任务排队期间的多次修改合并为一次写入 """
+        with self._lock:
+            self._dirty = True
+            if self._saving is None or self._saving.done():
+                self._saving = MiguService().scheduler.submit(self._flush, lane=Lane.prefetch)
+
+    def _flush(self):
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    self._saving = None
+                    return
+                self._dirty = False
+            self.save()
+
+    def _lookup_name(self, name: str) -> Tuple[bool, Optional[str]]:
+        entry = self._names.get(normalize_name(name))
+        if entry is None:
+            return False, None
+        aid, updated = entry
+        if aid is None and updated + self.MISS_TTL < time.time():
+            return False, None
+        return True, aid
+
+    def _mention(self, aid: str, names: Iterable[str], add: bool = True):
+        for name in names:
+            key = normalize_name(name)
+            if add:
+                self._mentions.setdefault(key, set()).add(aid)
+            else:
+                self._mentions.get(key, set()).discard(aid)
+
+    def _reindex_names(self, keys: Iterable[str]):
+        for aid in set().union(*(self._mentions.get(key, set()) for key in keys)):
+            self._reindex(aid)
+
+    def _reindex(self, aid: str):
+        """ 根据名字缓存重新计算某个歌手的出边，并维护反向索引 """
+        for old in self._out.get(aid, []):
+            self._in.get(old, set()).discard(aid)
+        out = []
+        for name in self._artists[aid]['similar_names']:
+            hit, target = self._lookup_name(name)
+            if hit and target is not None and target != aid and target not in out:
+                out.append(target)
+                self._display.setdefault(target, name)
+        self._out[aid] = out
+        for target in out:
+            self._in.setdefault(target, set()).add(aid)
+
+    def _pending_names(self) -> List[str]:
+        names = {}
+        for artist in self._artists.values():
+            for name in artist['similar_names']:
+                if not self._lookup_name(name)[0]:
+                    names.setdefault(normalize_name(name), name)
+        return list(names.values())
+
+    def _add_names(self, pairs: Iterable[Tuple[str, str]]) -> Set[str]:
+        changed = set()
+        for name, aid in pairs:
+            if not name or not aid:
+                continue
+            key = normalize_name(name)
+            if self._names.get(key, (None,))[0] != aid:
+                self._names[key] = (aid, time.time())
+                self._display.setdefault(aid, name.strip())
+                changed.add(key)
+        return changed
+
+    def add_names(self, pairs: Iterable[Tuple[str, str]]) -> bool:
+        """
+        记录已知的 (名字, id)，例如歌手搜索结果，顺带解析等待中的相似歌手。
+        只记录等待解析的相似歌手名，与关系图无关的名字直接忽略，避免名字表随搜索无限增长
+        """
+        with self._lock:
+            self._ensure_loaded()
+            changed = self._add_names((name, aid) for name, aid in pairs
+                                      if name and normalize_name(name) in self._mentions
+                                      and not self._lookup_name(name)[0])
+            if not changed:
+                return False
+            self._reindex_names(changed)
+        self._schedule_save()
+        return True
+
+    def add_detail(self, detail: 'ArtistDetail'):
+        """ 加入一个歌手详情，未解析的相似歌手名在后台搜索 """
+        if detail is None or not detail.artist_id:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            aid = detail.artist_id
+            artist = {
+                'name': detail.artist_name or '',
+                'similar_names': detail.similar_artist_names,
+                'works': detail.represent_work_titles,
+            }
+            old = self._artists.get(aid)
+            changed = old != artist
+            if old is not None:
+                self._mention(aid, old['similar_names'], add=False)
+            self._artists[aid] = artist
+            self._display[aid] = artist['name']
+            self._mention(aid, artist['similar_names'])
+            names = self._add_names([(detail.artist_name, aid)])
+            if not changed and not names:
+                return
+            self._reindex_names(names)
+            self._reindex(aid)
+            # 正在解析时不重复提交，解析任务结束前会再次检查新加入的名字
+            if self._pending_names() and (self._resolving is None or self._resolving.done()):
+                self._resolving = MiguService().scheduler.submit(self._resolve_pending, lane=Lane.prefetch)
+        self._schedule_save()
+
+    def _resolve_pending(self):
+        attempted = set()
+        while True:
+            with self._lock:
+                names = [name for name in self._pending_names() if normalize_name(name) not in attempted]
+                if not names:
+                    self._resolving = None
+                    return
+            resolved = set()
+            for name in names:
+                target = normalize_name(name)
+                attempted.add(target)
+                try:
+                    result = MiguService().search(name, SearchType.artist, 1, 5)
+                except (MiguException, requests.RequestException) as e:
+                    # 失败的名字留到下次加入歌手详情时重试
+                    logger.warning(f'artist name {name} resolve failed: {e}')
+                    continue
+                aid = next((a.id for a in result.artists or [] if a.title and normalize_name(a.title) == target),
+                           None)
+                with self._lock:
+                    self._names[target] = (aid, time.time())
+                    if aid is not None:
+                        self._display.setdefault(aid, name)
+                resolved.add(target)
+            with self._lock:
+                self._reindex_names(resolved)
+            self.save()
+
+    def wait(self, timeout: Optional[float] = None):
+        """ 等待后台的名字解析和保存完成 """
+        for attr in ('_resolving', '_saving'):
+            future = getattr(self, attr)
+            if future is not None:
+                future.result(timeout)
+
+    def name(self, aid: str) -> Optional[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._display.get(aid)
+
+    def works(self, aid: str) -> List[str]:
+        with self._lock:
+            self._ensure_loaded()
+            artist = self._artists.get(aid)
+            return list(artist['works']) if artist else []
+
+    def related(self, aid: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """
+        相关歌手：优先为该歌手的相似歌手，其次是将其列为相似歌手的歌手，最后按两跳路径数排序
+        :return: (id, 名字) 列表
+        """
+        with self._lock:
+            self._ensure_loaded()
+            ranked = list(self._out.get(aid, []))
+            ranked += sorted(self._in.get(aid, set()) - set(ranked))
+            if len(ranked) < limit:
+                seen = set(ranked) | {aid}
+                counter = Counter(second for first in ranked for second in self._out.get(first, [])
+                                  if second not in seen)
+                ranked += [second for second, _ in counter.most_common()]
+            return [(related, self._display.get(related, '')) for related in ranked[:limit]]
+
+    def radio(self, seeds: List[str], count: int, rng: Optional[random.Random] = None) -> List[str]:
+        """
+        以种子歌手为起点在关系图上随机游走，得到一组不重复的歌手，供电台式的播放队列扩展使用
+        """
+        rng = rng or random.Random()
+        seeds = list(dict.fromkeys(seeds))
+        with self._lock:
+            self._ensure_loaded()
+            visited = list(seeds)
+            current = visited[-1] if visited else None
+            misses = 0
+            while current is not None and len(visited) < count + len(seeds) and misses < count * 4:
+                candidates = [n for n in self._out.get(current, []) + sorted(self._in.get(current, set()))
+                              if n not in visited]
+                if not candidates:
+                    # 走到尽头，从已经访问过的歌手重新出发
+                    current = rng.choice(visited)
+                    misses += 1
+                    continue
+                current = rng.choice(candidates)
+                visited.append(current)
+            return visited[len(seeds):]
+
+
+from fuo_migu.schema import ArtistDetail, SearchType  # noqa: E402
+from fuo_migu.service import MiguService, MiguException  # noqa: E402
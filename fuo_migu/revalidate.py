@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger('migu')
+
+CacheKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Entry:
+    __slots__ = ('etag', 'last_modified', 'digest', 'result', 'model')
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], digest: str, result: Any):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.result = result
+        self.model = None
+
+
+def diff_fields(old: Any, new: Any, prefix: str = '') -> Set[str]:
+    """
+    比较两个解析结果，返回发生变化的字段路径（如 data.album_name），列表整体比较
+    :param old: 旧结果（schema 或 dict）
+    :param new: 新结果（schema 或 dict）
+    :rtype: Set[str]
+    """
+    if hasattr(old, 'dict'):
+        old = old.dict()
+    if hasattr(new, 'dict'):
+        new = new.dict()
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return set() if old == new else {prefix}
+    changed = set()
+    for name in old.keys() | new.keys():
+        path = f'{prefix}.{name}' if prefix else name
+        changed |= diff_fields(old.get(name), new.get(name), path)
+    return changed
+
+
+class RevalidationCache:
+    """
+    详情接口的重新验证缓存，按 (接口, 参数) 保存 ETag/Last-Modified 与响应体摘要。
+    响应未变化时直接返回上次的解析结果，不再解析和构造 model
+    """
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self._entries: 'OrderedDict[CacheKey, Entry]' = OrderedDict()
+        self._by_result: Dict[int, Entry] = {}
+        self._subscribers: List[Callable[[str, dict, Set[str]], None]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(uri: str, params: dict) -> CacheKey:
+        return uri, tuple(sorted((k, str(v)) for k, v in params.items()))
+
+    def subscribe(self, callback: Callable[[str, dict, Set[str]], None]):
+        """ 订阅内容变化，回调参数为 (接口地址, 请求参数, 变化的字段) """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, dict, Set[str]], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def conditional_headers(self, key: CacheKey) -> Dict[str, str]:
+        with self._lock:
+            entry = self._entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def not_modified(self, key: CacheKey, headers) -> Optional[Any]:
+        """ 处理 304 响应，返回缓存的解析结果 """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._update_validators(entry, headers)
+            return entry.result
+
+    def update(self, key: CacheKey, headers, content: bytes, parse: Callable[[bytes], Any]) -> Any:
+        """
+        处理 200 响应，响应体摘要未变化时跳过解析
+        :param parse: 解析函数，仅在内容变化时调用
+        :return: 解析结果
+        """
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.digest == digest:
+                self._entries.move_to_end(key)
+                self._update_validators(entry, headers)
+                return entry.result
+        result = parse(content)
+        changed = diff_fields(entry.result, result) if entry is not None else set()
+        with self._lock:
+            if entry is not None:
+                self._by_result.pop(id(entry.result), None)
+            new_entry = Entry(headers.get('ETag'), headers.get('Last-Modified'), digest, result)
+            self._entries[key] = new_entry
+            self._entries.move_to_end(key)
+            self._by_result[id(result)] = new_entry
+            while len(self._entries) > self.MAX_ENTRIES:
+                _, evicted = self._entries.popitem(last=False)
+                self._by_result.pop(id(evicted.result), None)
+        if changed:
+            uri, params = key
+            for callback in list(self._subscribers):
+                try:
+                    callback(uri, dict(params), changed)
+                except Exception:
+                    logger.exception('revalidation subscriber failed')
+        return result
+
+    def model(self, result: Any, build: Callable[[], Any]) -> Any:
+        """ 同一个解析结果只构造一次 model """
+        with self._lock:
+            entry = self._by_result.get(id(result))
+            if entry is not None and entry.result is result and entry.model is not None:
+                return entry.model
+        model = build()
+        with self._lock:
+            if entry is not None and entry.result is result:
+                entry.model = model
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_result.clear()
+
+    @staticmethod
+    def _update_validators(entry: Entry, headers):
+        entry.etag = headers.get('ETag') or entry.etag
+        entry.last_modified = headers.get('Last-Modified') or entry.last_modified
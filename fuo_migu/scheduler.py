@@ -0,0 +1,230 @@
+import heapq
+import itertools
+import logging
+import threading
+from concurrent.futures import CancelledError, Future
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Callable, Dict, Hashable, List, Optional, Set
+
+
+logger = logging.getLogger('migu')
+
+
+class Lane(IntEnum):
+    """ 优先级通道，数值越小越优先 """
+    now_playing = 0
+    visible = 1
+    prefetch = 2
+
+
+class _Ticket:
+    __slots__ = ('lane', 'seq', 'group', 'cancelled')
+
+    def __init__(self, lane: Lane, seq: int, group: Optional[Hashable]):
+        self.lane = lane
+        self.seq = seq
+        self.group = group
+        self.cancelled = False
+
+    def __lt__(self, other: '_Ticket'):
+        return (self.lane, self.seq) < (other.lane, other.seq)
+
+
+class _Context:
+    """ 线程当前的通道和分组；ticket 为正在等待名额的请求，提升优先级时一并调整 """
+    __slots__ = ('lane', 'group', 'ticket')
+
+    def __init__(self, lane: Lane, group: Optional[Hashable]):
+        self.lane = lane
+        self.group = group
+        self.ticket: Optional[_Ticket] = None
+
+
+class _Task(_Context):
+    __slots__ = ('seq', 'fn', 'args', 'future')
+
+    def __init__(self, lane: Lane, group: Optional[Hashable], seq: int, fn: Callable, args: tuple):
+        super().__init__(lane, group)
+        self.seq = seq
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+
+    def __lt__(self, other: '_Task'):
+        return (self.lane, self.seq) < (other.lane, other.seq)
+
+
+class Scheduler:
+    """
+    请求调度器。所有经过 MiguSession 的请求都要先取得一个名额，
+    名额总数即全局并发预算，等待者按 (通道, 先后) 排队；预取通道不能占用最后 reserved 个名额，
+    保证正在播放和可见行的请求总能及时开始。
+    后台任务同样按 (通道, 先后) 排队交给工作线程，可以通过 promote 提升已提交任务的优先级。
+    通过 context 为当前线程指定通道和分组，cancel 分组时，排队中的请求和任务都会被取消
+    """
+
+    def __init__(self, budget: int = 6, reserved: int = 1, workers: int = 4):
+        self.budget = budget
+        self.reserved = min(reserved, budget - 1)
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting: List[_Ticket] = []
+        self._queue: List[_Task] = []
+        self._threads: List[threading.Thread] = []
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._tasks: Dict[Future, _Task] = {}
+        self._groups: Dict[Hashable, Set[Future]] = {}
+
+    def _contexts(self) -> List[_Context]:
+        contexts = getattr(self._local, 'contexts', None)
+        if contexts is None:
+            contexts = self._local.contexts = []
+        return contexts
+
+    @contextmanager
+    def _enter(self, context: _Context):
+        contexts = self._contexts()
+        contexts.append(context)
+        try:
+            yield
+        finally:
+            contexts.pop()
+
+    @contextmanager
+    def context(self, lane: Lane, group: Optional[Hashable] = None, weak: bool = False):
+        """
+        指定当前线程之后请求所属的通道和分组
+        :param weak: 为 True 时，如果外层已经指定了通道则不覆盖
+        """
+        if weak and self._contexts():
+            yield
+            return
+        with self._enter(_Context(lane, group)):
+            yield
+
+    def current(self) -> tuple:
+        contexts = self._contexts()
+        return (contexts[-1].lane, contexts[-1].group) if contexts else (Lane.visible, None)
+
+    def _can_start(self, ticket: _Ticket) -> bool:
+        limit = self.budget - self.reserved if ticket.lane == Lane.prefetch else self.budget
+        return self._waiting[0] is ticket and self._running < limit
+
+    @contextmanager
+    def slot(self):
+        """ 占用一个并发名额，同一线程内重入时（如重定向）不重复占用 """
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        contexts = self._contexts()
+        context = contexts[-1] if contexts else _Context(Lane.visible, None)
+        with self._cond:
+            ticket = context.ticket = _Ticket(context.lane, next(self._seq), context.group)
+            heapq.heappush(self._waiting, ticket)
+            while not ticket.cancelled and not self._can_start(ticket):
+                self._cond.wait()
+            context.ticket = None
+            if ticket.cancelled:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise CancelledError(f'request cancelled: {ticket.group}')
+            heapq.heappop(self._waiting)
+            self._running += 1
+            self._cond.notify_all()
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def submit(self, fn: Callable, *args, lane: Lane = Lane.prefetch, group: Optional[Hashable] = None) -> Future:
+        """ 在后台执行任务，任务按通道优先级出队，任务中的请求使用同样的通道和分组 """
+        task = _Task(lane, group, next(self._seq), fn, args)
+        with self._cond:
+            self._tasks[task.future] = task
+            if group is not None:
+                self._groups.setdefault(group, set()).add(task.future)
+            heapq.heappush(self._queue, task)
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'migu-scheduler-{len(self._threads)}',
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify_all()
+        return task.future
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                task = heapq.heappop(self._queue)
+            if task.future.set_running_or_notify_cancel():
+                with self._enter(task):
+                    try:
+                        result = task.fn(*task.args)
+                    except BaseException as e:
+                        task.future.set_exception(e)
+                    else:
+                        task.future.set_result(result)
+            with self._cond:
+                self._tasks.pop(task.future, None)
+                futures = self._groups.get(task.group)
+                if futures is not None:
+                    futures.discard(task.future)
+                    if not futures:
+                        self._groups.pop(task.group, None)
+
+    def promote(self, future: Future, lane: Lane) -> bool:
+        """
+        提升已提交任务的优先级：排队中的任务提前出队，正在等待名额的请求提前获得名额
+        :return: 任务是否仍在调度器中
+        """
+        with self._cond:
+            task = self._tasks.get(future)
+            if task is None:
+                return False
+            if lane < task.lane:
+                task.lane = lane
+                heapq.heapify(self._queue)
+                if task.ticket is not None:
+                    task.ticket.lane = lane
+                    heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            return True
+
+    def cancel(self, group: Hashable) -> int:
+        """
+        取消分组中尚未开始的请求和任务，已经在进行中的请求不受影响
+        :return: 取消的数量
+        """
+        with self._cond:
+            count = 0
+            for ticket in self._waiting:
+                if ticket.group == group and not ticket.cancelled:
+                    ticket.cancelled = True
+                    count += 1
+            futures = list(self._groups.get(group, ()))
+            self._cond.notify_all()
+        count += sum(1 for future in futures if future.cancel())
+        return count
+
+    @property
+    def stats(self) -> dict:
+        with self._cond:
+            waiting = {lane.name: 0 for lane in Lane}
+            for ticket in self._waiting:
+                waiting[ticket.lane.name] += 1
+            return {'running': self._running, 'waiting': waiting}
@@ -1,13 +1,36 @@
+import json
 import re
 from datetime import date
 from enum import Enum
-from typing import List, Optional, Type
+from typing import Callable, Dict, List, NamedTuple, Optional, Type
 
 from pydantic import BaseModel as _Base, Field
 
+from fuo_migu.profiling import profiled, profiler
+
 
 class BaseSchema(_Base):
-    pass
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # 为每个 model() 记录 fuocore model 构造的耗时
+        model = cls.__dict__.get('model')
+        if model is not None:
+            cls.model = profiled(f'{cls.__qualname__}.model')(model)
+
+
+# 由 projection 模块注册的快速解析器，键为结果类型
+PROJECTIONS: Dict[Type[BaseSchema], Callable[[object], BaseSchema]] = {}
+
+
+def parse_content(result_type: Type[BaseSchema], content: bytes):
+    """ 与 parse_raw 等价，分开记录 JSON 解码与 pydantic 校验的耗时 """
+    with profiler.span('json'):
+        data = json.loads(content)
+    with profiler.span('validate'):
+        projection = PROJECTIONS.get(result_type)
+        if projection is not None:
+            return projection(data)
+        return result_type.parse_obj(data)
 
 
 class SearchType(Enum):
@@ -212,6 +235,22 @@ class ArtistDetail(BaseSchema):
     similar_artist: Optional[str] = Field(alias='similarArtist')  # 相似歌手名
     weight: Optional[int]  # 体重
 
+    @property
+    def similar_artist_names(self) -> List[str]:
+        if self.similar_artist is None:
+            return []
+        names = [name.strip() for name in re.split(r'[,，、;；/|]', self.similar_artist)]
+        return list(dict.fromkeys(name for name in names if name and name != self.artist_name))
+
+    @property
+    def represent_work_titles(self) -> List[str]:
+        if self.represent_works is None:
+            return []
+        titles = re.findall(r'《([^》]+)》', self.represent_works)
+        if not titles:
+            titles = re.split(r'[,，、;；/|]', self.represent_works)
+        return list(dict.fromkeys(title.strip() for title in titles if title.strip()))
+
 
 class AlbumDetail(BaseSchema):
     id: Optional[str]
@@ -237,6 +276,69 @@ class AlbumDetail(BaseSchema):
                                           desc=self.album_intro or '')
 
 
+# videoUrlMap 中的格式编号 -> (画质, 分辨率高度, 估算码率 kbps)。
+# 接口不返回分辨率和码率，对应关系是根据实际播放地址推测的；码率只是粗略的估计值，
+# 同一画质下的两个编号哪个码率更高并没有依据，按带宽选择只能作为大致的参考
+MV_FORMATS = {
+    '050013': ('sd', 480, 800),
+    '050014': ('hd', 720, 1500),
+    '050015': ('fhd', 1080, 3000),
+    '050018': ('hd', 720, 1200),
+    '050019': ('fhd', 1080, 2500),
+}
+
+# 由高到低，与 fuocore 的 Quality.Video 一致
+MV_QUALITIES = ['fhd', 'hd', 'sd', 'ld']
+
+
+class MvVariant(NamedTuple):
+    key: str
+    url: str
+    quality: Optional[str]
+    height: Optional[int]
+    bandwidth: Optional[int]
+
+
+def select_variant(variants: List[MvVariant], quality: Optional[str] = None,
+                   bandwidth: Optional[int] = None) -> Optional[MvVariant]:
+    """
+    从 MV 的多个清晰度中选择一个
+    :param variants: 可选的清晰度列表
+    :param quality: 期望画质（fhd/hd/sd/ld），不存在时选择最接近的画质，同等距离优先较低画质
+    :param bandwidth: 可用带宽上限（kbps），优先选择不超过该值的最高码率；码率为 MV_FORMATS 中的估计值，结果仅供参考
+    :return: 选中的清晰度或 None
+    :rtype: Optional[MvVariant]
+    """
+    candidates = [v for v in variants if v.quality is not None] or list(variants)
+    if not candidates:
+        return None
+    if bandwidth is not None:
+        known = [v for v in candidates if v.bandwidth is not None]
+        fits = [v for v in known if v.bandwidth <= bandwidth]
+        if fits:
+            candidates = fits
+        elif known:
+            lowest = min(v.bandwidth for v in known)
+            candidates = [v for v in known if v.bandwidth == lowest]
+    if quality is not None and quality in MV_QUALITIES:
+        target = MV_QUALITIES.index(quality)
+
+        def distance(v: MvVariant):
+            if v.quality not in MV_QUALITIES:
+                return len(MV_QUALITIES), 0
+            idx = MV_QUALITIES.index(v.quality)
+            return abs(idx - target), -idx
+
+        nearest = min(distance(v) for v in candidates)
+        candidates = [v for v in candidates if distance(v) == nearest]
+
+    def rank(v: MvVariant):
+        idx = MV_QUALITIES.index(v.quality) if v.quality in MV_QUALITIES else len(MV_QUALITIES)
+        return -idx, v.bandwidth or 0
+
+    return max(candidates, key=rank)
+
+
 class MvDetail(BaseSchema):
     class MvSchema(BaseSchema):
         class MvKv(BaseSchema):
@@ -251,19 +353,35 @@ class MvDetail(BaseSchema):
     videos: Optional[MvSchema] = Field(alias='videoUrlMap')
 
     @property
-    def url(self):
-        if self.videos and self.videos.entry:
-            for kv in self.videos.entry:
-                if kv.value:
-                    return kv.value
-        return None
+    def variants(self) -> List[MvVariant]:
+        if not self.videos or not self.videos.entry:
+            return []
+        variants = []
+        for kv in self.videos.entry:
+            if not kv.value:
+                continue
+            quality, height, bandwidth = MV_FORMATS.get(kv.key, (None, None, None))
+            variants.append(MvVariant(kv.key, kv.value, quality, height, bandwidth))
+        return variants
 
-    def model(self):
-        url = self.url
-        if url is None:
+    def select(self, quality: Optional[str] = None, bandwidth: Optional[int] = None) -> Optional[MvVariant]:
+        return select_variant(self.variants, quality, bandwidth)
+
+    @property
+    def url(self):
+        variant = self.select()
+        return variant.url if variant is not None else None
+
+    def model(self, cpid: Optional[str] = None):
+        """
+        :param cpid: 请求该详情时使用的 mv_copyright_id，作为 model 的 identifier；
+            详情中的 copyrightId 与之不同，不能用于再次请求
+        """
+        variants = self.variants
+        if not variants:
             return None
-        return migu_models.MiguMvModel(identifier=self.copyright_id, name=self.content_name, desc=self.actor_name,
-                                       media=migu_models.Media(url))
+        return migu_models.MiguMvModel(identifier=cpid or self.copyright_id, name=self.content_name,
+                                       desc=self.actor_name or '', variants=variants)
 
 
 class PlaylistTag(BaseSchema):
@@ -1,8 +1,14 @@
-from typing import Type, Optional, Union
+from concurrent.futures import Future
+from typing import Callable, List, Type, Optional, Union
 
 import requests
 import logging
+from requests.adapters import BaseAdapter, HTTPAdapter
 
+from fuo_migu.executor import Backend, InlineBackend, to_model
+from fuo_migu.profiling import profiled, profiler
+from fuo_migu.revalidate import RevalidationCache
+from fuo_migu.scheduler import Lane, Scheduler
 from fuo_migu.util import Singleton
 
 
@@ -13,6 +19,16 @@ class MiguException(BaseException):
     pass
 
 
+class MiguSession(requests.Session):
+    def __init__(self, scheduler: Scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    def send(self, request, **kwargs):
+        with self.scheduler.slot(), profiler.span('http'):
+            return super().send(request, **kwargs)
+
+
 class MiguService(metaclass=Singleton):
     HOST = 'm.music.migu.cn'
     REFERER = 'https://m.music.migu.cn/migu/l/'
@@ -20,18 +36,75 @@ class MiguService(metaclass=Singleton):
          'Chrome/86.0.4240.198 Mobile Safari/537.36'
 
     def __init__(self):
-        self.session = requests.Session()
+        self.scheduler = Scheduler()
+        self.session = MiguSession(self.scheduler)
         self.session.headers.update({
             'host': self.HOST,
             'referer': self.REFERER,
             'user-agent': self.UA
         })
         self.session.hooks = dict(response=self.request_tracing)
+        self.backend: Backend = InlineBackend()
+        self.revalidation = RevalidationCache()
+        self.artist_graph = ArtistGraph()
+
+    def set_backend(self, backend: Backend):
+        """ 切换解析所用的执行后端，旧的后端会被关闭 """
+        old, self.backend = self.backend, backend
+        if old is not backend:
+            old.shutdown()
+
+    def mount(self, adapter: Optional[BaseAdapter] = None):
+        """ 替换传输层，例如 cassette 的录制/回放；不传参数时恢复为真实网络请求 """
+        for prefix in ('http://', 'https://'):
+            old = self.session.adapters.get(prefix)
+            self.session.mount(prefix, adapter or HTTPAdapter())
+            if old is not None and old is not adapter:
+                old.close()
+
+    def _parse(self, result_type: Type, content: bytes):
+        return self.backend.run(parse_content, result_type, content)
+
+    def run_async(self, fn: Callable, *args, lane: Lane = Lane.visible) -> Future:
+        """ 在调度器的工作线程中完成请求和解析，调用方（如 GUI 线程）不被阻塞 """
+        return self.scheduler.submit(fn, *args, lane=lane)
+
+    def hydrate_async(self, schemas: Optional[List]) -> Future:
+        """ 通过执行后端构造 model，Future 的结果为 model 列表；列表为 null 时视为空 """
+        return self.backend.map_async(to_model, schemas or [])
+
+    def search_async(self, keyword: str, stype: 'SearchType', page: int = 1, page_size: int = 20) -> Future:
+        return self.run_async(self.search, keyword, stype, page, page_size)
+
+    def artist_songs_async(self, aid: str, page: int = 1, page_size: int = 20) -> Future:
+        return self.run_async(self.artist_songs, aid, page, page_size)
+
+    def album_songs_async(self, aid: str, page: int = 1, page_size: int = 20) -> Future:
+        return self.run_async(self.album_songs, aid, page, page_size)
+
+    def playlist_songs_async(self, pid: str, ptype: int = 2, content_count: int = 20) -> Future:
+        return self.run_async(self.playlist_songs, pid, ptype, content_count)
+
+    def _get_revalidated(self, uri: str, params: dict, result_type: Type):
+        """ 带条件请求的 GET，内容未变化时返回上次的解析结果 """
+        key = self.revalidation.key(uri, params)
+        headers = self.revalidation.conditional_headers(key)
+        with self.session.get(uri, params=params, headers=headers) as r:
+            if r.status_code == 304:
+                result = self.revalidation.not_modified(key, r.headers)
+                if result is None:
+                    raise MiguException('Error: HTTP 304 without cached response')
+                return result
+            if r.status_code != 200:
+                raise MiguException(f'Error: HTTP {r.status_code}')
+            return self.revalidation.update(key, r.headers, r.content,
+                                            lambda content: self._parse(result_type, content))
 
     @staticmethod
     def request_tracing(r: requests.Response, *args, **kwargs):
         logger.info(f'Request: [{r.request.method}] {r.request.url}')
 
+    @profiled('service.search')
     def search(self, keyword: str, stype: 'SearchType', page: int = 1, page_size: int = 20) \
             -> Union[
                 'SongSearchResult', 'ArtistSearchResult', 'AlbumSearchResult', 'PlaylistSearchResult', 'MvSearchResult']:
@@ -51,40 +124,41 @@ class MiguService(metaclass=Singleton):
                 stype)
             if result_type is None:
                 raise MiguException(f'Unsupported type')
-            return result_type.parse_raw(r.content)
+            result = self._parse(result_type, r.content)
+        if stype == SearchType.artist and result.artists:
+            self.artist_graph.add_names((a.title, a.id) for a in result.artists)
+        return result
 
+    @profiled('service.song_detail')
     def song_detail(self, cpid: str) -> 'SongDetailResult':
         uri = 'https://m.music.migu.cn/migu/remoting/cms_detail_tag'
         params = {'cpid': cpid}
         with self.session.get(uri, params=params) as r:
             if r.status_code != 200:
                 raise MiguException(f'Error: HTTP {r.status_code}')
-            return SongDetailResult.parse_raw(r.content)
+            return self._parse(SongDetailResult, r.content)
 
+    @profiled('service.artist_detail')
     def artist_detail(self, aid: str) -> 'ArtistDetailResult':
         uri = 'https://m.music.migu.cn/migu/remoting/cms_artist_detail_tag'
         params = {'artistId': aid}
-        with self.session.get(uri, params=params) as r:
-            if r.status_code != 200:
-                raise MiguException(f'Error: HTTP {r.status_code}')
-            return ArtistDetailResult.parse_raw(r.content)
+        result = self._get_revalidated(uri, params, ArtistDetailResult)
+        self.artist_graph.add_detail(result.data)
+        return result
 
+    @profiled('service.album_detail')
     def album_detail(self, aid: str):
         uri = 'https://m.music.migu.cn/migu/remoting/cms_album_detail_tag'
         params = {'albumId': aid}
-        with self.session.get(uri, params=params) as r:
-            if r.status_code != 200:
-                raise MiguException(f'Error: HTTP {r.status_code}')
-            return AlbumDetailResult.parse_raw(r.content)
+        return self._get_revalidated(uri, params, AlbumDetailResult)
 
+    @profiled('service.playlist_detail')
     def playlist_detail(self, pid: str) -> 'PlaylistDetailResult':
         uri = 'https://m.music.migu.cn/migu/remoting/query_playlist_by_id_tag'
         params = {'playListId': pid}
-        with self.session.get(uri, params=params) as r:
-            if r.status_code != 200:
-                raise MiguException(f'Error: HTTP {r.status_code}')
-            return PlaylistDetailResult.parse_raw(r.content)
+        return self._get_revalidated(uri, params, PlaylistDetailResult)
 
+    @profiled('service.artist_songs')
     def artist_songs(self, aid: str, page: int = 1, page_size: int = 20) -> 'ArtistSongsResult':
         uri = 'https://m.music.migu.cn/migu/remoting/cms_artist_song_list_tag'
         params = {
@@ -95,8 +169,9 @@ class MiguService(metaclass=Singleton):
         with self.session.get(uri, params=params) as r:
             if r.status_code != 200:
                 raise MiguException(f'Error: HTTP {r.status_code}')
-            return ArtistSongsResult.parse_raw(r.content)
+            return self._parse(ArtistSongsResult, r.content)
 
+    @profiled('service.album_songs')
     def album_songs(self, aid: str, page: int = 1, page_size: int = 20):
         uri = 'https://m.music.migu.cn/migu/remoting/cms_album_song_list_tag'
         params = {
@@ -107,8 +182,9 @@ class MiguService(metaclass=Singleton):
         with self.session.get(uri, params=params) as r:
             if r.status_code != 200:
                 raise MiguException(f'Error: HTTP {r.status_code}')
-            return AlbumSongsResult.parse_raw(r.content)
+            return self._parse(AlbumSongsResult, r.content)
 
+    @profiled('service.playlist_songs')
     def playlist_songs(self, pid: str, ptype: int = 2, content_count: int = 20):
         uri = 'https://m.music.migu.cn/migu/remoting/playlistcontents_query_tag'
         params = {
@@ -119,16 +195,18 @@ class MiguService(metaclass=Singleton):
         with self.session.get(uri, params=params) as r:
             if r.status_code != 200:
                 raise MiguException(f'Error: HTTP {r.status_code}')
-            return PlaylistSongsResult.parse_raw(r.content)
+            return self._parse(PlaylistSongsResult, r.content)
 
+    @profiled('service.mv_detail')
     def mv_detail(self, cpid: str) -> Optional['MvDetailResult']:
         uri = 'https://m.music.migu.cn/migu/remoting/mv_detail_tag'
         params = {'cpid': cpid, 'n': 3}
         with self.session.get(uri, params=params) as r:
             if r.status_code != 200:
                 raise MiguException(f'Error: HTTP {r.status_code}')
-            return MvDetailResult.parse_raw(r.content)
+            return self._parse(MvDetailResult, r.content)
 
+    @profiled('service.get_song_media')
     def get_song_media(self, cpid: str, content_id: str, quality: str = 'hq'):
         tone_flags = {
             'lq': 'LQ',
@@ -148,7 +226,9 @@ class MiguService(metaclass=Singleton):
             'resourceType': '2',
             'channel': '0'
         }
-        with self.session.head(uri, params=params) as r:
+        # 默认视为正在播放的请求，预取下一首时可以在外层指定其他通道
+        with self.scheduler.context(Lane.now_playing, weak=True), \
+                self.session.head(uri, params=params) as r:
             if r.status_code != 305:
                 raise MiguException(f'Error: HTTP {r.status_code}')
             url = r.headers.get('location')
@@ -159,7 +239,8 @@ class MiguService(metaclass=Singleton):
 
 from fuo_migu.schema import get_result_by_stype, SongSearchResult, ArtistSearchResult, AlbumSearchResult, \
     PlaylistSearchResult, MvSearchResult, SongDetailResult, ArtistDetailResult, ArtistSongsResult, AlbumDetailResult, \
-    PlaylistDetailResult, PlaylistSongsResult, AlbumSongsResult, SearchType, MvDetailResult
+    PlaylistDetailResult, PlaylistSongsResult, AlbumSongsResult, SearchType, MvDetailResult, parse_content
+from fuo_migu.relations import ArtistGraph
 
 if __name__ == '__main__':
     print(MiguService().mv_detail('600570YA7ZS'))
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import pytest
+
+from fuo_migu.cassette import Cassette, CassetteError, Interaction, RecordingAdapter, ReplayAdapter, \
+    run_virtual_clients
+from fuo_migu.schema import SearchType
+from fuo_migu.service import MiguService
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+SEARCH_URL = 'https://m.music.migu.cn/migu/remoting/scr_search_tag?rows=10&type=2&keyword=only+my+railgun&pgc=1'
+MEDIA_URL = 'http://app.pd.nf.migu.cn/MIGUM2.0/v1.0/content/sub/listenSong.do?toneFlag=HQ&netType=00' \
+            '&userId=15548614588710179085069&ua=Android_migu&version=5.1&copyrightId=1&contentId=2' \
+            '&resourceType=2&channel=0'
+
+
+@pytest.fixture
+def cassette():
+    return Cassette([
+        Interaction('GET', SEARCH_URL, 200, {'Content-Type': 'application/json;charset=UTF-8'},
+                    (EXAMPLE / 'search_songs.json').read_bytes(), elapsed=0.01),
+        Interaction('HEAD', MEDIA_URL, 305, {'location': 'http://example.com/song.mp3'}, b''),
+    ])
+
+
+@pytest.fixture
+def service():
+    service = MiguService()
+    yield service
+    service.mount()
+
+
+class TestCassette:
+    def test_replay(self, cassette, service):
+        service.mount(ReplayAdapter(cassette))
+        result = service.search('only my railgun', SearchType.song, 1, 10)
+        assert result.success is True
+        assert len(result.musics) > 0
+        assert service.get_song_media('1', '2', 'hq') == 'http://example.com/song.mp3'
+        with pytest.raises(CassetteError):
+            service.song_detail('missing')
+
+    def test_record_roundtrip(self, cassette, service, tmp_path):
+        path = tmp_path / 'search.jsonl.gz'
+        service.mount(RecordingAdapter(path, ReplayAdapter(cassette)))
+        service.get_song_media('1', '2', 'hq')
+        # 没有关闭之前已经写入文件
+        assert [i.status for i in Cassette.load(path).interactions] == [305]
+        service.search('only my railgun', SearchType.song, 1, 10)
+        service.mount()
+        recorded = Cassette.load(path)
+        assert [i.status for i in recorded.interactions] == [305, 200]
+        assert recorded.interactions[0].headers['location'] == 'http://example.com/song.mp3'
+        assert recorded.interactions[1].body == cassette.interactions[0].body
+
+    def test_virtual_clients(self, cassette, service):
+        service.mount(ReplayAdapter(cassette, timing_scale=1.0))
+        results = run_virtual_clients(
+            lambda client: len(service.search('only my railgun', SearchType.song, 1, 10).musics), 8)
+        assert all(r.error is None for r in results)
+        assert len({r.result for r in results}) == 1
+        assert min(r.seconds for r in results) >= 0.01
@@ -0,0 +1,88 @@
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+from fuo_migu.executor import Backend, BackendMode, chain, create_backend, to_model
+from fuo_migu.models import create_g
+from fuo_migu.schema import ArtistSongsResult
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+class TestBackend:
+    @pytest.mark.parametrize('mode', list(BackendMode))
+    def test_parse_and_hydrate(self, mode):
+        backend = create_backend(mode, max_workers=2)
+        try:
+            result = backend.run(ArtistSongsResult.parse_raw, (EXAMPLE / 'artist_songs.json').read_bytes())
+            songs = backend.map(to_model, result.result.results, chunk_size=7)
+        finally:
+            backend.shutdown()
+        assert [song.identifier for song in songs] == [o.copyright_id for o in result.result.results]
+        assert backend.stats.tasks == 4
+        if mode == BackendMode.process:
+            assert backend.stats.pickle_bytes > 0
+        else:
+            assert backend.stats.pickle_bytes == 0
+
+    def test_exception(self):
+        backend = create_backend(BackendMode.inline)
+        with pytest.raises(ValueError):
+            backend.run(ArtistSongsResult.parse_raw, b'not json')
+
+    @pytest.mark.parametrize('mode', list(BackendMode))
+    def test_map_async(self, mode):
+        backend = create_backend(mode, max_workers=2)
+        result = ArtistSongsResult.parse_raw((EXAMPLE / 'artist_songs.json').read_bytes())
+        try:
+            future = chain(backend.submit(len, result.result.results),
+                           lambda count: backend.map_async(to_model, result.result.results[:count], chunk_size=7))
+            songs = future.result(30)
+            assert backend.map_async(to_model, []).result() == []
+        finally:
+            backend.shutdown()
+        assert [song.identifier for song in songs] == [o.copyright_id for o in result.result.results]
+
+    def test_chain_exception(self):
+        future = Future()
+        chained = chain(future, lambda _: create_backend(BackendMode.inline).submit(int, 'x'))
+        future.set_result(None)
+        with pytest.raises(ValueError):
+            chained.result()
+
+    def test_abstract(self):
+        with pytest.raises(TypeError):
+            Backend()
+
+
+class TestPagedModels:
+    def test_create_g(self):
+        result = ArtistSongsResult.parse_raw((EXAMPLE / 'artist_songs.json').read_bytes())
+        result.result.total_count = len(result.result.results) * 2
+        empty = result.copy(deep=True)
+        empty.result.results = []
+        pages = []
+
+        def artist_songs(aid, page, page_size):
+            pages.append(page)
+            return result if page <= 2 else empty
+
+        reader = create_g(artist_songs, '1')
+        songs = list(reader)
+        assert len(songs) == len(result.result.results) * 2
+        # 第二页在消费第一页之前已经开始请求
+        assert pages[:2] == [1, 2]
+
+    def test_create_g_null_results(self):
+        result = ArtistSongsResult.parse_raw((EXAMPLE / 'artist_songs.json').read_bytes())
+        result.result.total_count = len(result.result.results) * 2
+        null = result.copy(deep=True)
+        # 最后一页的 results 为 null 时同样视为结束
+        null.result.results = None
+
+        def artist_songs(aid, page, page_size):
+            return result if page == 1 else null
+
+        assert len(list(create_g(artist_songs, '1'))) == len(result.result.results)
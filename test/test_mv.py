@@ -0,0 +1,160 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from fuo_migu.models import MiguMvModel, MiguVideoModel
+from fuo_migu.mv import MvResolver
+from fuo_migu.scheduler import Scheduler
+from fuo_migu.schema import MvDetailResult, MvVariant, select_variant
+from fuo_migu.service import MiguException
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+def load_detail():
+    return MvDetailResult.parse_file(EXAMPLE / 'mv_detail.json').data
+
+
+class TestMvVariants:
+    def test_parse_variants(self):
+        variants = load_detail().variants
+        assert [v.key for v in variants] == ['050018', '050013', '050019', '050014']
+        assert all(v.url.startswith('https://') for v in variants)
+
+    def test_select_by_quality(self):
+        detail = load_detail()
+        assert detail.select().quality == 'fhd'
+        assert detail.select(quality='hd').key == '050014'
+        assert detail.select(quality='sd').key == '050013'
+        # 没有 ld 时选择最接近的 sd
+        assert detail.select(quality='ld').key == '050013'
+
+    def test_select_by_bandwidth(self):
+        # 只验证选择逻辑，不依赖 MV_FORMATS 中估计的码率
+        variants = [MvVariant('a', 'a', 'sd', 480, 500), MvVariant('b', 'b', 'hd', 720, 1000),
+                    MvVariant('c', 'c', 'fhd', 1080, 2000)]
+        assert select_variant(variants, bandwidth=1500).key == 'b'
+        assert select_variant(variants, bandwidth=100).key == 'a'
+        assert select_variant(variants, quality='fhd', bandwidth=1500).key == 'b'
+        assert select_variant(variants, quality='sd', bandwidth=5000).key == 'a'
+
+    def test_select_empty(self):
+        assert select_variant([]) is None
+
+
+class TestMvResolver:
+    def test_cache_expire(self, monkeypatch):
+        resolver = MvResolver()
+        resolver.invalidate()
+        result = MvDetailResult.parse_file(EXAMPLE / 'mv_detail.json')
+        detail = result.data
+        calls = []
+
+        class FakeService:
+            scheduler = Scheduler()
+
+            def mv_detail(self, cpid):
+                calls.append(cpid)
+                return result
+
+        monkeypatch.setattr('fuo_migu.mv.MiguService', FakeService)
+        assert resolver.resolve('600570YA7ZS') is detail
+        assert resolver.resolve_many(['600570YA7ZS', '600570YA7ZS']) == {'600570YA7ZS': detail}
+        assert calls == ['600570YA7ZS']
+
+        monkeypatch.setattr(MvResolver, 'TTL', -1)
+        resolver.invalidate()
+        resolver.resolve('600570YA7ZS')
+        time.sleep(0.01)
+        resolver.resolve('600570YA7ZS')
+        assert calls == ['600570YA7ZS'] * 3
+
+    def test_visible_resolve_skips_prefetch_queue(self, monkeypatch):
+        resolver = MvResolver()
+        resolver.invalidate()
+        result = MvDetailResult.parse_file(EXAMPLE / 'mv_detail.json')
+        scheduler = Scheduler(budget=1, reserved=0, workers=1)
+        release = threading.Event()
+        calls = []
+
+        class FakeService:
+            def mv_detail(self, cpid):
+                calls.append((cpid, threading.current_thread() is main))
+                return result
+
+        FakeService.scheduler = scheduler
+        main = threading.current_thread()
+        monkeypatch.setattr('fuo_migu.mv.MiguService', FakeService)
+        blocker = scheduler.submit(release.wait, 5)
+        resolver.prefetch(['600570YA7ZS'], group='search')
+        # 排队中的预取被取消，在调用方线程直接请求
+        assert resolver.resolve('600570YA7ZS') is result.data
+        release.set()
+        blocker.result(5)
+        assert calls == [('600570YA7ZS', True)]
+
+    def test_mv_model_reuses_resolver_cache(self, monkeypatch):
+        resolver = MvResolver()
+        resolver.invalidate()
+        result = MvDetailResult.parse_file(EXAMPLE / 'mv_detail.json')
+        calls = []
+
+        class FakeService:
+            scheduler = Scheduler()
+
+            def mv_detail(self, cpid):
+                calls.append(cpid)
+                return result
+
+        monkeypatch.setattr('fuo_migu.mv.MiguService', FakeService)
+        mv = MiguMvModel.get('600570YA7ZS')
+        # 详情中的 copyrightId 为 600570YA7ZSD，model 仍以请求时的 mv_copyright_id 为 identifier
+        assert mv.identifier == '600570YA7ZS'
+        assert mv.list_quality() == ['fhd', 'hd', 'sd']
+        assert mv.get_media('hd').url == result.data.select(quality='hd').url
+        assert mv.media.url == result.data.url
+        assert calls == ['600570YA7ZS']
+
+        # 播放地址不缓存在 model 上，解析缓存过期后重新请求
+        video = MiguVideoModel(identifier='600570YA7ZS', title='情话')
+        assert video.media.url == result.data.url
+        assert calls == ['600570YA7ZS']
+        resolver.invalidate()
+        assert video.media.url == result.data.url
+        assert calls == ['600570YA7ZS'] * 2
+
+    def test_fetch_fails_fast(self, monkeypatch):
+        resolver = MvResolver()
+        resolver.invalidate()
+        calls = []
+
+        class SlowScheduler(Scheduler):
+            def submit(self, *args, **kwargs):
+                future = super().submit(*args, **kwargs)
+                # 让任务在返回之前完成
+                time.sleep(0.05)
+                return future
+
+        class FailingService:
+            scheduler = SlowScheduler()
+
+            def mv_detail(self, cpid):
+                calls.append(cpid)
+                raise MiguException('Error: HTTP 500')
+
+        monkeypatch.setattr('fuo_migu.mv.MiguService', FailingService)
+        results = []
+        # 任务在注册回调之前就已经失败，不能死锁
+        thread = threading.Thread(target=lambda: results.append(resolver.resolve_many(['a', 'b'])), daemon=True)
+        thread.start()
+        thread.join(5)
+        assert results == [{}]
+        resolver.prefetch(['c'])
+        assert 'c' in calls
+        # 失败的请求不会留在 _pending 中，之后重新请求
+        with pytest.raises(MiguException):
+            resolver.resolve('a')
+        assert sorted(calls) == ['a', 'a', 'b', 'c']
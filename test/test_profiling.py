@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from fuo_migu.executor import BackendMode, create_backend, to_model
+from fuo_migu.profiling import ProfileMode, profiler
+from fuo_migu.schema import ArtistSongsResult, parse_content
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+class TestProfiling:
+    def test_spans(self, tmp_path):
+        profiler.reset()
+        profiler.enable(ProfileMode.spans)
+        try:
+            with profiler.span('hydrate'):
+                result = parse_content(ArtistSongsResult, (EXAMPLE / 'artist_songs.json').read_bytes())
+                for o in result.result.results:
+                    o.model()
+        finally:
+            profiler.disable()
+        summary = profiler.summary()
+        assert summary['hydrate']['count'] == 1
+        assert summary['SongDetail.model']['count'] == len(result.result.results)
+        paths = profiler.dump(tmp_path)
+        assert {p.name for p in paths} >= {'spans.collapsed', 'summary.json'}
+        collapsed = (tmp_path / 'spans.collapsed').read_text(encoding='utf-8')
+        assert 'hydrate;json ' in collapsed
+        assert 'hydrate;validate ' in collapsed
+        assert json.loads((tmp_path / 'summary.json').read_text(encoding='utf-8'))['hydrate']['count'] == 1
+
+    def test_sampling(self, tmp_path):
+        profiler.reset()
+        profiler.enable(ProfileMode.sampling, interval=0.001)
+        try:
+            with profiler.span('hydrate'):
+                deadline = time.perf_counter() + 0.1
+                while time.perf_counter() < deadline:
+                    parse_content(ArtistSongsResult, (EXAMPLE / 'artist_songs.json').read_bytes())
+            idle = threading.Event()
+            thread = threading.Thread(target=idle.wait, args=(0.05,), name='idle-thread')
+            thread.start()
+            thread.join()
+        finally:
+            profiler.disable()
+        # sampling 模式不计时，区段只用于标注采样
+        assert profiler.summary() == {}
+        paths = profiler.dump(tmp_path)
+        assert 'samples.collapsed' in {p.name for p in paths}
+        samples = (tmp_path / 'samples.collapsed').read_text(encoding='utf-8')
+        main = threading.current_thread().name
+        assert f'{main};hydrate;' in samples
+        # 不在区段内的线程同样被采样
+        assert '\nidle-thread;' in '\n' + samples
+
+    def test_disabled(self):
+        profiler.reset()
+        with profiler.span('noop'):
+            pass
+        assert profiler.summary() == {}
+
+    @pytest.mark.parametrize('mode', [BackendMode.thread, BackendMode.process])
+    def test_backend_spans(self, mode, tmp_path):
+        backend = create_backend(mode, max_workers=1)
+        content = (EXAMPLE / 'artist_songs.json').read_bytes()
+        profiler.reset()
+        profiler.enable(ProfileMode.spans)
+        try:
+            with profiler.span('service.artist_songs'):
+                result = backend.run(parse_content, ArtistSongsResult, content)
+                backend.map(to_model, result.result.results)
+        finally:
+            profiler.disable()
+            backend.shutdown()
+        # 工作线程/子进程中的区段接在调用方的区段之下
+        name = f'backend.{mode.value}'
+        summary = profiler.summary()
+        assert summary['SongDetail.model']['count'] == len(result.result.results)
+        assert summary[name]['count'] == 2
+        profiler.dump(tmp_path)
+        collapsed = (tmp_path / 'spans.collapsed').read_text(encoding='utf-8')
+        assert f'service.artist_songs;{name};validate ' in collapsed
+        assert f'service.artist_songs;{name};SongDetail.model ' in collapsed
+        assert '\nvalidate ' not in '\n' + collapsed
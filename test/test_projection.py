@@ -0,0 +1,79 @@
+import json
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+from fuo_migu.projection import FieldUsage, ProjectionParser, disable_projection, enable_projection, seed_fields
+from fuo_migu.schema import AlbumSearchResult, MvDetailResult, SongSearchResult, parse_content
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+class TestFieldUsage:
+    def test_track_and_dump(self, tmp_path):
+        usage = FieldUsage()
+        usage.observe(AlbumSearchResult)
+        usage.enable()
+        try:
+            result = AlbumSearchResult.parse_file(EXAMPLE / 'search_album.json')
+            [o.model() for o in result.albums]
+        finally:
+            usage.disable()
+        assert not usage.enabled
+        used = usage.used()
+        assert used['AlbumSearchResult'] == {'albums'}
+        assert used['SearchAlbum'] == {'id', 'title', 'album_pic_m', 'singer'}
+        assert used['SearchAlbum.Singer'] == {'id', 'name'}
+        path = tmp_path / 'usage.json'
+        usage.dump(path)
+        assert FieldUsage.load(path) == used
+        assert 'publish_date' in json.loads(path.read_text(encoding='utf-8'))['SearchAlbum']['unused']
+
+
+class TestProjection:
+    used = {'SongSearchResult': {'musics', 'success'}, 'SearchSong': {'copyright_id', 'title', 'has_mv'}}
+
+    def test_same_as_full_parse(self):
+        data = json.loads((EXAMPLE / 'search_songs.json').read_text(encoding='utf-8'))
+        full = SongSearchResult.parse_obj(data)
+        projection = ProjectionParser(SongSearchResult, self.used)
+        projected = projection(data)
+        assert projection.fallbacks == 0
+        assert projected.success == full.success
+        for a, b in zip(projected.musics, full.musics):
+            assert (a.copyright_id, a.title, a.has_mv) == (b.copyright_id, b.title, b.has_mv)
+            # model() 读取的字段即使没有统计到也会解码
+            assert (a.album_name, a.singer_name) == (b.album_name, b.singer_name)
+            assert a.mp3 is None
+
+    def test_fallback_on_drift(self):
+        data = json.loads((EXAMPLE / 'search_songs.json').read_text(encoding='utf-8'))
+        data['musics'][0]['title'] = {'unexpected': 'shape'}
+        projection = ProjectionParser(SongSearchResult, {})
+        # 回退到完整校验，报错与 parse_obj 一致
+        with pytest.raises(ValidationError):
+            projection(data)
+        assert projection.fallbacks == 1
+
+    def test_parse_content(self):
+        content = (EXAMPLE / 'search_songs.json').read_bytes()
+        enable_projection(self.used, [SongSearchResult])
+        try:
+            result = parse_content(SongSearchResult, content)
+        finally:
+            disable_projection()
+        assert result.musics[0].mp3 is None
+        assert parse_content(SongSearchResult, content).musics[0].mp3 is not None
+
+    def test_seed_method_fields(self):
+        used = {'MvDetailResult': {'data'}, 'MvDetail': {'content_name'}, 'MvDetail.MvSchema': set(),
+                'MvDetail.MvSchema.MvKv': set()}
+        seeded = seed_fields(MvDetailResult, used)
+        assert seeded['MvDetail'] == {'content_name', 'copyright_id', 'actor_name', 'videos'}
+        assert seeded['MvDetail.MvSchema'] == {'entry'}
+        assert seeded['MvDetail.MvSchema.MvKv'] == {'key', 'value'}
+        data = json.loads((EXAMPLE / 'mv_detail.json').read_text(encoding='utf-8'))
+        detail = ProjectionParser(MvDetailResult, used)(data).data
+        assert detail.variants == MvDetailResult.parse_obj(data).data.variants
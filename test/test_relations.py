@@ -0,0 +1,88 @@
+import random
+import threading
+from pathlib import Path
+
+import requests
+
+from fuo_migu.relations import ArtistGraph
+from fuo_migu.scheduler import Scheduler
+from fuo_migu.schema import ArtistDetail, ArtistDetailResult, ArtistSearchResult, SearchArtist
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+class FakeService:
+    scheduler = Scheduler()
+
+    searched = []
+
+    def search(self, keyword, stype, page=1, page_size=20):
+        self.searched.append(keyword)
+        return ArtistSearchResult(artists=[SearchArtist(id=f'id-{keyword}', title=keyword)])
+
+
+class TestArtistGraph:
+    def test_parse_fields(self):
+        detail = ArtistDetailResult.parse_file(EXAMPLE / 'artist_detail.json').data
+        assert detail.similar_artist_names[:2] == ['林俊杰', '陈奕迅']
+        assert detail.represent_work_titles == ['龙卷风', '菊花台', '青花瓷', '晴天']
+
+    def test_build_and_persist(self, monkeypatch, tmp_path):
+        monkeypatch.setattr('fuo_migu.relations.MiguService', FakeService)
+        FakeService.searched = []
+        path = tmp_path / 'graph.json'
+        graph = ArtistGraph(path)
+        # 歌手详情中的歌手名直接记录，不需要再搜索
+        graph.add_detail(ArtistDetail(artistId='2', artistName='陈奕迅'))
+        graph.add_detail(ArtistDetailResult.parse_file(EXAMPLE / 'artist_detail.json').data)
+        graph.wait(5)
+        assert '陈奕迅' not in FakeService.searched
+        assert graph.related('112', 2) == [('id-林俊杰', '林俊杰'), ('2', '陈奕迅')]
+
+        graph.add_detail(ArtistDetail(artistId='2', artistName='陈奕迅', similarArtist='周杰伦, 张学友'))
+        assert graph.related('112')[:2] == [('id-林俊杰', '林俊杰'), ('2', '陈奕迅')]
+        assert ('112', '周杰伦') in graph.related('2')
+        # 与关系图无关的搜索结果不记录
+        assert not graph.add_names([('无关歌手', '9')])
+        graph.wait(5)
+
+        reloaded = ArtistGraph(path)
+        assert reloaded.related('112') == graph.related('112')
+        assert reloaded.works('112') == ['龙卷风', '菊花台', '青花瓷', '晴天']
+        queue = reloaded.radio(['112'], 5, random.Random(0))
+        assert len(queue) == 5
+        assert len(set(queue)) == 5
+        assert '112' not in queue
+
+    def test_names_added_while_resolving(self, monkeypatch, tmp_path):
+        started, release = threading.Event(), threading.Event()
+        searched = []
+
+        class BlockingService(FakeService):
+            def search(self, keyword, stype, page=1, page_size=20):
+                searched.append(keyword)
+                if keyword == '林俊杰':
+                    started.set()
+                    release.wait(5)
+                if keyword == '陈奕迅':
+                    raise requests.ConnectionError('reset')
+                return ArtistSearchResult(artists=[SearchArtist(id=f'id-{keyword}', title=keyword)])
+
+        monkeypatch.setattr('fuo_migu.relations.MiguService', BlockingService)
+        path = tmp_path / 'graph.json'
+        graph = ArtistGraph(path)
+        graph.add_detail(ArtistDetail(artistId='1', artistName='A', similarArtist='林俊杰, 陈奕迅'))
+        assert started.wait(5)
+        # 解析进行中加入的名字同样会被解析
+        graph.add_detail(ArtistDetail(artistId='2', artistName='B', similarArtist='张学友'))
+        release.set()
+        graph.wait(5)
+        assert sorted(searched) == sorted(['林俊杰', '陈奕迅', '张学友'])
+        assert graph.related('2') == [('id-张学友', '张学友')]
+        # 网络错误不影响同一批的其他名字，结果已经保存
+        assert ArtistGraph(path).related('1') == [('id-林俊杰', '林俊杰')]
+
+        assert graph.add_names([('陈奕迅', '3')])
+        graph.wait(5)
+        assert ArtistGraph(path).related('1') == [('id-林俊杰', '林俊杰'), ('3', '陈奕迅')]
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from fuo_migu.revalidate import RevalidationCache, diff_fields
+from fuo_migu.schema import AlbumDetailResult
+
+
+EXAMPLE = Path(__file__).parent.parent / 'example'
+
+
+class TestRevalidation:
+    def test_skip_unchanged(self):
+        cache = RevalidationCache()
+        key = cache.key('album', {'albumId': 1})
+        content = (EXAMPLE / 'album_detail.json').read_bytes()
+        parsed = []
+        changes = []
+
+        def parse(body):
+            parsed.append(body)
+            return AlbumDetailResult.parse_raw(body)
+
+        cache.subscribe(lambda uri, params, changed: changes.append((uri, params, changed)))
+        first = cache.update(key, {'ETag': '"v1"'}, content, parse)
+        assert cache.conditional_headers(key) == {'If-None-Match': '"v1"'}
+        assert cache.update(key, {}, content, parse) is first
+        assert cache.not_modified(key, {}) is first
+        assert len(parsed) == 1
+
+        modified = content.replace(first.data.album_name.encode('utf-8'), b'renamed')
+        second = cache.update(key, {}, modified, parse)
+        assert second.data.album_name == 'renamed'
+        assert changes == [('album', {'albumId': '1'}, {'data.album_name'})]
+
+    def test_model_built_once(self):
+        cache = RevalidationCache()
+        key = cache.key('album', {})
+        result = cache.update(key, {}, b'{"data": null}', AlbumDetailResult.parse_raw)
+        built = []
+        cache.model(result, lambda: built.append(1) or object())
+        cache.model(result, lambda: built.append(1) or object())
+        assert built == [1]
+
+    def test_diff_fields(self):
+        assert diff_fields({'a': {'b': 1, 'c': [1]}}, {'a': {'b': 1, 'c': [2]}}) == {'a.c'}
+        assert diff_fields({'a': 1}, {'a': 1}) == set()
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from fuo_migu.scheduler import Lane, Scheduler
+
+
+class TestScheduler:
+    def test_priority_and_budget(self):
+        scheduler = Scheduler(budget=2, reserved=1, workers=8)
+        release = threading.Event()
+        started = []
+
+        def request(name):
+            with scheduler.slot():
+                started.append(name)
+                release.wait(5)
+
+        blocker = scheduler.submit(request, 'blocker', lane=Lane.visible)
+        while scheduler.stats['running'] != 1:
+            time.sleep(0.001)
+        # 预取不能占用保留的名额
+        prefetch = scheduler.submit(request, 'prefetch', lane=Lane.prefetch)
+        while scheduler.stats['waiting']['prefetch'] != 1:
+            time.sleep(0.001)
+        playing = scheduler.submit(request, 'playing', lane=Lane.now_playing)
+        while scheduler.stats['running'] != 2:
+            time.sleep(0.001)
+        assert started == ['blocker', 'playing']
+        release.set()
+        for future in (blocker, prefetch, playing):
+            future.result(5)
+        assert started[-1] == 'prefetch'
+
+    def test_cancel_group(self):
+        scheduler = Scheduler(budget=1, reserved=0, workers=4)
+        release = threading.Event()
+
+        def request():
+            with scheduler.slot():
+                release.wait(5)
+
+        blocker = scheduler.submit(request, lane=Lane.visible)
+        while scheduler.stats['running'] != 1:
+            time.sleep(0.001)
+        waiting = scheduler.submit(request, group='album:1')
+        while scheduler.stats['waiting']['prefetch'] != 1:
+            time.sleep(0.001)
+        assert scheduler.cancel('album:1') == 1
+        with pytest.raises(CancelledError):
+            waiting.result(5)
+        release.set()
+        blocker.result(5)
+        assert scheduler.stats == {'running': 0, 'waiting': {'now_playing': 0, 'visible': 0, 'prefetch': 0}}
+
+    def test_reentrant_and_context(self):
+        scheduler = Scheduler(budget=1, reserved=0)
+        with scheduler.context(Lane.now_playing):
+            with scheduler.context(Lane.prefetch, weak=True):
+                assert scheduler.current() == (Lane.now_playing, None)
+            with scheduler.slot(), scheduler.slot():
+                assert scheduler.stats['running'] == 1
+        assert scheduler.current() == (Lane.visible, None)
+
+    def test_visible_task_overtakes_queued_prefetch(self):
+        scheduler = Scheduler(budget=1, reserved=0, workers=2)
+        order = []
+
+        def request(name):
+            with scheduler.slot():
+                order.append(name)
+                time.sleep(0.02)
+
+        prefetches = [scheduler.submit(request, f'prefetch-{i}') for i in range(10)]
+        visible = scheduler.submit(request, 'visible', lane=Lane.visible)
+        visible.result(5)
+        for future in prefetches:
+            future.result(5)
+        # 最多排在已经被工作线程取走的任务之后
+        assert order.index('visible') <= 2
+
+    def test_promote_queued_task(self):
+        scheduler = Scheduler(budget=1, reserved=0, workers=1)
+        release = threading.Event()
+        order = []
+
+        blocker = scheduler.submit(release.wait, 5)
+        prefetches = [scheduler.submit(order.append, i) for i in range(5)]
+        assert scheduler.promote(prefetches[-1], Lane.visible)
+        release.set()
+        for future in [blocker] + prefetches:
+            future.result(5)
+        assert order == [4, 0, 1, 2, 3]
+        assert not scheduler.promote(prefetches[-1], Lane.visible)
@@ -1,10 +1,31 @@
+from pathlib import Path
+
+import pytest
+
+from fuo_migu.cassette import Cassette, Interaction, ReplayAdapter
 from fuo_migu.schema import SearchType, SongSearchResult
 from fuo_migu.service import MiguService
 
 
+EXAMPLE = Path(__file__).parent.parent / 'example'
+SEARCH_URL = 'https://m.music.migu.cn/migu/remoting/scr_search_tag?rows=10&type=2&keyword=only+my+railgun&pgc=1'
+
+
+@pytest.fixture
+def service():
+    # 从示例响应回放，测试不依赖网络
+    service = MiguService()
+    service.mount(ReplayAdapter(Cassette([
+        Interaction('GET', SEARCH_URL, 200, {'Content-Type': 'application/json;charset=UTF-8'},
+                    (EXAMPLE / 'search_songs.json').read_bytes()),
+    ])))
+    yield service
+    service.mount()
+
+
 class TestService:
-    def test_search_songs(self):
-        result: SongSearchResult = MiguService().search('only my railgun', SearchType.song, 1, 10)
+    def test_search_songs(self, service):
+        result: SongSearchResult = service.search('only my railgun', SearchType.song, 1, 10)
         assert result.success is True
         assert result.musics is not None
         assert len(result.musics) > 0